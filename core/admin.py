@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import (Employee, Enterprise, PatrolLog, Planning, Site, Tag, Zone)
+from .models import (ArchivedPatrolLog, AudioUpload, ComplianceRollup, Employee, Enterprise, MissedCheckpoint,
+                     PatrolLog, Planning, Site, Tag, TenantMembership, Zone)
 
 
 # Register your models here.
@@ -10,6 +11,13 @@ admin.site.register(PatrolLog)
 admin.site.register(Planning)
 
 
+@admin.register(MissedCheckpoint)
+class MissedCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('patrol_log', 'due_datetime', 'detected_datetime')
+    list_select_related = ('patrol_log__tag',)
+    ordering = ('-due_datetime',)
+
+
 @admin.register(Site)
 class SiteAdmin(admin.ModelAdmin):
     list_display = ('designation', 'enterprise')
@@ -26,4 +34,32 @@ class ZoneAdmin(admin.ModelAdmin):
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ('designation', 'site')
     ordering = ('designation',)
-    search_fields = ('designation','site',)
\ No newline at end of file
+    search_fields = ('designation','site',)
+
+@admin.register(ComplianceRollup)
+class ComplianceRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'zone', 'planned', 'checked', 'late', 'missed')
+    list_filter = ('site', 'enterprise')
+    list_select_related = ('zone__site__enterprise',)
+    ordering = ('-day',)
+
+
+@admin.register(ArchivedPatrolLog)
+class ArchivedPatrolLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tag', 'check_datetime', 'is_checked', 'checked_by', 'archived')
+    list_select_related = ('tag', 'checked_by')
+    ordering = ('-check_datetime',)
+
+
+@admin.register(AudioUpload)
+class AudioUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'patrol_log', 'offset', 'size', 'completed')
+    ordering = ('-created',)
+
+
+@admin.register(TenantMembership)
+class TenantMembershipAdmin(admin.ModelAdmin):
+    list_display = ('user', 'enterprise', 'site')
+    list_filter = ('enterprise',)
+    list_select_related = ('user', 'enterprise', 'site')
+    search_fields = ('user__username',)
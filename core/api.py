@@ -7,15 +7,64 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
 from django.http import Http404
-
-
-from core.models import (Employee, Enterprise, Site, Tag, PatrolLog, Planning, Zone)
+from django.utils.http import parse_etags
+
+
+from core.archive import archive_covers
+from core.caching import VersionedCacheMixin
+from core.compliance import local_day, refresh_rollups
+from core.conditional import ConditionalGetMixin
+from core.exports import EXPORT_FORMATS, export_response
+from core.fieldsets import SparseFieldsetMixin
+from core.filters import ComplianceRollupFilterBackend, PatrolLogFilterBackend
+from core.images import image_pipeline
+from core.pagination import DueKeysetPagination, KeysetPagination
+from core.permissions import ChangeModelPermissions
+from core.rounds import get_round
+from core.scanning import ScanError, ScanEvent, record_scan, record_scans
+from core.tenancy import TenantScopedMixin, scope_queryset
+from core.uploads import UploadError, append_chunk, discard_upload
+from core.models import (ArchivedPatrolLog, AudioUpload, ComplianceRollup, Employee, Enterprise, MissedCheckpoint,
+                         Site, Tag, PatrolLog, Planning, Zone)
 from core.serializers import (EmployeeSerializer, EnterpriseSerializer, SiteSerializer,
-                              TagSerializer, PatrolLogSerializer, PlanningSerializer, ZoneSerializer)
-
-
-class EnterpriseViewSet(viewsets.ReadOnlyModelViewSet): 
+                              TagSerializer, PatrolLogSerializer, PlanningSerializer, ZoneSerializer,
+                              RoundCheckpointSerializer, ScanSerializer, SyncScanSerializer,
+                              MissedCheckpointSerializer, ComplianceRollupSerializer, ComplianceTotalSerializer,
+                              AudioUploadSerializer)
+
+SCAN_SYNC_MAX_EVENTS = getattr(settings, 'SCAN_SYNC_MAX_EVENTS', 500)
+COMPLIANCE_GROUPS = {
+    'zone': 'zone_id',
+    'site': 'site_id',
+    'enterprise': 'enterprise_id',
+}
+UPLOAD_ERROR_STATUS = {
+    UploadError.OFFSET_MISMATCH: status.HTTP_409_CONFLICT,
+    UploadError.TOO_LARGE: status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    UploadError.COMPLETED: status.HTTP_409_CONFLICT,
+    UploadError.INTERRUPTED: status.HTTP_400_BAD_REQUEST,
+    UploadError.BUSY: status.HTTP_409_CONFLICT,
+    UploadError.UNSUPPORTED: status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+}
+FIELDSET_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Comma separated fields to return (default: all)"),
+    openapi.Parameter('expand', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Comma separated relations to embed instead of their ID, dotted for nested "
+                                  "ones (e.g. tag.zone)"),
+]
+SCAN_ERROR_STATUS = {
+    ScanError.UNKNOWN_TAG: status.HTTP_404_NOT_FOUND,
+    ScanError.WRONG_SITE: status.HTTP_400_BAD_REQUEST,
+    ScanError.NO_OPEN_CHECKPOINT: status.HTTP_404_NOT_FOUND,
+}
+
+
+class EnterpriseViewSet(SparseFieldsetMixin, TenantScopedMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet): 
     queryset = Enterprise.objects.all()
     serializer_class = EnterpriseSerializer
     
@@ -25,26 +74,26 @@ class EnterpriseViewSet(viewsets.ReadOnlyModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of enterprises",  
         operation_description="Returns a list of all enterprises in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: EnterpriseSerializer, 404: "Not found"})
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        data, validators = self.get_cached_list()
+        return self.conditional_response(validators, lambda: Response(data))
 
     @swagger_auto_schema(
         operation_summary="Get a single enterprise",  
         operation_description="Returns a single enterprise by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: EnterpriseSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
-            enterprise = self.get_object()
+            data, validators = self.get_cached_object(pk)
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(enterprise)
-        return Response(serializer.data)
+        return self.conditional_response(validators, lambda: Response(data))
 
-class SiteViewSet(viewsets.ReadOnlyModelViewSet):
+class SiteViewSet(SparseFieldsetMixin, TenantScopedMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Site.objects.all()
     serializer_class = SiteSerializer
 
@@ -54,30 +103,30 @@ class SiteViewSet(viewsets.ReadOnlyModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of sites",  
         operation_description="Returns a list of all sites in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: SiteSerializer, 
             404: "Not found"
             })
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        data, validators = self.get_cached_list()
+        return self.conditional_response(validators, lambda: Response(data))
 
     @swagger_auto_schema(
         operation_summary="Get a single site",  
         operation_description="Returns a single site by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: SiteSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
-            site = self.get_object()
+            data, validators = self.get_cached_object(pk)
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(site)
-        return Response(serializer.data)
+        return self.conditional_response(validators, lambda: Response(data))
 
 
-class ZoneViewSet(viewsets.ReadOnlyModelViewSet):
+class ZoneViewSet(SparseFieldsetMixin, TenantScopedMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Zone.objects.all()
     serializer_class = ZoneSerializer
 
@@ -87,30 +136,30 @@ class ZoneViewSet(viewsets.ReadOnlyModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of zones",  
         operation_description="Returns a list of all zones in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: ZoneSerializer, 
             404: "Not found"
             })
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        data, validators = self.get_cached_list()
+        return self.conditional_response(validators, lambda: Response(data))
 
     @swagger_auto_schema(
         operation_summary="Get a single zone",  
         operation_description="Returns a single zone by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: ZoneSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
-            enterprise = self.get_object()
+            data, validators = self.get_cached_object(pk)
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(enterprise)
-        return Response(serializer.data)
+        return self.conditional_response(validators, lambda: Response(data))
 
 
-class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
+class EmployeeViewSet(SparseFieldsetMixin, TenantScopedMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Employee.objects.all()
     serializer_class = EmployeeSerializer
 
@@ -120,30 +169,44 @@ class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of employees",  
         operation_description="Returns a list of all employee in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: EmployeeSerializer, 
             404: "Not found"
             })
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        data, validators = self.get_cached_list()
+        return self.conditional_response(validators, lambda: Response(data))
     
     @swagger_auto_schema(
         operation_summary="Get a single employee",  
         operation_description="Returns a single employee by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: EmployeeSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
-            employee = self.get_object()
+            data, validators = self.get_cached_object(pk)
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(employee)
-        return Response(serializer.data)
-
+        return self.conditional_response(validators, lambda: Response(data))
 
-class TagViewSet(viewsets.ModelViewSet):
+    @swagger_auto_schema(
+        operation_summary="Get the current round of an employee",
+        operation_description="Returns the unchecked checkpoints of the employee's site that are open now "
+                              "(current) or due soon (next), ordered by check time and tag order. "
+                              "Send the ETag back in If-None-Match to get a 304 when nothing changed",
+        responses={200: RoundCheckpointSerializer(many=True), 304: "Not modified", 404: "Not found"})
+    @action(detail=True, methods=['get'], url_path='round')
+    def round(self, request, pk=None):
+        employee = self.get_object()
+        payload, etag = get_round(employee.site_id)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(payload, headers={'ETag': etag})
+
+
+class TagViewSet(SparseFieldsetMixin, TenantScopedMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
@@ -153,18 +216,20 @@ class TagViewSet(viewsets.ModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of tags",  
         operation_description="Returns a list of all tags in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: TagSerializer, 
             404: "Not found"
             })
     def list(self, request):    
         queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.conditional_response(self.get_list_validators(queryset),
+                                         lambda: Response(self.get_serializer(queryset, many=True).data))
     
     @swagger_auto_schema(
         operation_summary="Get a single tag",  
         operation_description="Returns a single tag by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: TagSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
@@ -172,8 +237,8 @@ class TagViewSet(viewsets.ModelViewSet):
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(tag)
-        return Response(serializer.data)
+        return self.conditional_response(self.get_object_validators(tag),
+                                         lambda: Response(self.get_serializer(tag).data))
     
     @swagger_auto_schema(
         operation_summary="Create a new tag",
@@ -221,37 +286,57 @@ class TagViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class PatrolLogViewSet(viewsets.ModelViewSet):
+class PatrolLogViewSet(SparseFieldsetMixin, TenantScopedMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = PatrolLog.objects.all()
     serializer_class = PatrolLogSerializer
 
     permission_classes = [IsAuthenticated, DjangoObjectPermissions]
+    pagination_class = KeysetPagination
+    filter_backends = [PatrolLogFilterBackend]
     basename = 'patrolLog'
+
+    def get_archive_queryset(self):
+        return self.optimize_queryset(scope_queryset(ArchivedPatrolLog.objects.all(), self.request.user))
+
+    def get_read_querysets(self):
+        """The filtered patrol logs, plus the archived ones when the `from` filter reaches the archive."""
+        querysets = [self.filter_queryset(self.get_queryset())]
+        start = self.request.query_params.get('from')
+        if archive_covers(PatrolLogFilterBackend.parse_datetime('from', start) if start else None):
+            querysets.append(self.filter_queryset(self.get_archive_queryset()))
+        return querysets
     
     @swagger_auto_schema(
         operation_summary="Get a list of patrolLogs",  
-        operation_description="Returns a list of all patrolLogs in the system", 
+        operation_description="Returns a page of patrolLogs ordered by check_datetime, use the next/previous "
+                              "links to browse the other pages. Can be filtered by zone, site, employee, "
+                              "from/to (check_datetime) and is_checked. Archived patrolLogs are included "
+                              "when the period reaches them",
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: PatrolLogSerializer, 
             404: "Not found"
             })
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginator.paginate_querysets(self.get_read_querysets(), request, view=self)
+        return self.conditional_response(self.get_page_validators(page),
+                                         lambda: self.get_paginated_response(self.get_serializer(page, many=True).data))
 
     @swagger_auto_schema(
         operation_summary="Get a single patrolLog",  
-        operation_description="Returns a single patrolLog by ID", 
+        operation_description="Returns a single patrolLog by ID, archived ones included",
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: PatrolLogSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
             patrolLog = self.get_object()
         except Http404:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+            patrolLog = self.get_archive_queryset().filter(pk=pk).first()
+            if patrolLog is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(patrolLog)
-        return Response(serializer.data)
+        return self.conditional_response(self.get_object_validators(patrolLog),
+                                         lambda: Response(self.get_serializer(patrolLog).data))
 
     @swagger_auto_schema(
         operation_summary="Create a new patrolLog",
@@ -289,6 +374,78 @@ class PatrolLogViewSet(viewsets.ModelViewSet):
         self.perform_update(serializer)
         return Response(serializer.data)
 
+    @swagger_auto_schema(
+        operation_summary="Export patrolLogs",
+        operation_description="Streams every patrolLog matching the list filters as CSV (default) or NDJSON "
+                              "(?type=ndjson), ordered by check_datetime",
+        manual_parameters=[openapi.Parameter('type', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                             enum=sorted(EXPORT_FORMATS))],
+        responses={200: "CSV or NDJSON file", 400: "Bad request"})
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('type', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'type': f'Expected one of: {", ".join(EXPORT_FORMATS)}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return export_response(self.get_read_querysets(), export_format, 'patrol-logs')
+
+    @swagger_auto_schema(
+        operation_summary="Record an NFC scan",
+        operation_description="Marks as checked the patrolLog of the scanned tag whose window "
+                              "(check_datetime +/- check_tolerance) contains the scan time (default: now)",
+        request_body=ScanSerializer,
+        responses={200: PatrolLogSerializer, 400: "Bad request", 404: "Unknown tag or no open patrolLog"})
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, ChangeModelPermissions])
+    def scan(self, request):
+        serializer = ScanSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        try:
+            patrolLog = record_scan(**serializer.validated_data)
+        except ScanError as e:
+            return Response({'code': e.code, 'detail': e.message}, status=SCAN_ERROR_STATUS[e.code])
+        return Response(self.get_serializer(patrolLog).data)
+
+    @swagger_auto_schema(
+        operation_summary="Replay a batch of NFC scans",
+        operation_description="Applies a list of scans recorded offline in a single transaction and returns one "
+                              "result per scan, in the same order: status is 'checked', 'already_checked' (the "
+                              "scan was applied by a previous request, e.g. a retried batch) or an error code",
+        request_body=SyncScanSerializer(many=True),
+        responses={200: "Per scan results", 400: "Bad request"})
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, ChangeModelPermissions])
+    def sync(self, request):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'A list of scans is expected.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > SCAN_SYNC_MAX_EVENTS:
+            return Response({'detail': f'At most {SCAN_SYNC_MAX_EVENTS} scans can be sent at once.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(request.data)
+        items = []
+        for index, item in enumerate(request.data):
+            serializer = SyncScanSerializer(data=item)
+            if serializer.is_valid():
+                items.append((index, serializer.validated_data))
+            else:
+                results[index] = {'status': 'invalid', 'errors': serializer.errors}
+
+        employees = scope_queryset(Employee.objects.all(), request.user).in_bulk(
+            {data['employee'] for _, data in items})
+        events = []
+        for index, data in items:
+            if data['employee'] in employees:
+                events.append((index, ScanEvent(data['code_nfc'], employees[data['employee']], data['scanned_at'])))
+            else:
+                results[index] = {'status': 'unknown_employee', 'detail': 'Unknown employee.'}
+
+        for (index, _), result in zip(events, record_scans([event for _, event in events])):
+            if result.error is None:
+                results[index] = {'status': 'already_checked' if result.already_checked else 'checked',
+                                  'patrol_log': result.patrol_log.pk}
+            else:
+                results[index] = {'status': result.error.code, 'detail': result.error.message}
+        return Response([dict(result, index=index) for index, result in enumerate(results)])
+
     @swagger_auto_schema(
         operation_summary="Delete an patrolLog",
         operation_description="Deletes an existing patrolLog from the system",
@@ -298,10 +455,29 @@ class PatrolLogViewSet(viewsets.ModelViewSet):
         self.perform_destroy(patrolLog)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        patrolLog = serializer.save()
+        if serializer.validated_data.get('image_path'):
+            image_pipeline.submit(patrolLog.pk)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        # The signals of the save (missed checkpoint, rollup) run in its transaction
+        patrolLog = serializer.save()
+        if serializer.validated_data.get('image_path'):
+            image_pipeline.submit(patrolLog.pk)
 
+    def perform_destroy(self, instance):
+        # PatrolLog has no post_delete receiver, keep the rollup of the day in sync here
+        rollup_key = (instance.tag.zone_id, local_day(instance.check_datetime))
+        instance.delete()
+        refresh_rollups({rollup_key})
 
 
-class PlanningViewSet(viewsets.ReadOnlyModelViewSet):
+
+
+class PlanningViewSet(SparseFieldsetMixin, TenantScopedMixin, VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Planning.objects.all()
     serializer_class = PlanningSerializer
 
@@ -311,27 +487,182 @@ class PlanningViewSet(viewsets.ReadOnlyModelViewSet):
     @swagger_auto_schema(
         operation_summary="Get a list of plannings",  
         operation_description="Returns a list of all plannings in the system", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={
             200: PlanningSerializer, 
             404: "Not found"
             })
     def list(self, request):    
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        data, validators = self.get_cached_list()
+        return self.conditional_response(validators, lambda: Response(data))
 
     @swagger_auto_schema(
         operation_summary="Get a single planning",  
         operation_description="Returns a single planning by ID", 
+        manual_parameters=FIELDSET_PARAMETERS,
         responses={200: PlanningSerializer(), 404: "Not found"})
     def retrieve(self, request, pk=None):
         try:
-            planning = self.get_object()
+            data, validators = self.get_cached_object(pk)
         except Http404:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        serializer = self.get_serializer(planning)
-        return Response(serializer.data)
+        return self.conditional_response(validators, lambda: Response(data))
+
+
+class MissedCheckpointViewSet(SparseFieldsetMixin, TenantScopedMixin, ConditionalGetMixin,
+                              viewsets.ReadOnlyModelViewSet):
+    queryset = MissedCheckpoint.objects.all()
+    serializer_class = MissedCheckpointSerializer
+    pagination_class = DueKeysetPagination
+
+    permission_classes = [IsAuthenticated, DjangoObjectPermissions]
+    basename = 'missedCheckpoint'
+
+    @swagger_auto_schema(
+        operation_summary="Get a list of missed checkpoints",
+        operation_description="Returns a page of the patrolLogs not checked before their due time, ordered by "
+                              "due time",
+        manual_parameters=FIELDSET_PARAMETERS,
+        responses={200: MissedCheckpointSerializer, 404: "Not found"})
+    def list(self, request):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.conditional_response(self.get_page_validators(page),
+                                         lambda: self.get_paginated_response(self.get_serializer(page, many=True).data))
+
+    @swagger_auto_schema(
+        operation_summary="Get a single missed checkpoint",
+        operation_description="Returns a single missed checkpoint by ID",
+        manual_parameters=FIELDSET_PARAMETERS,
+        responses={200: MissedCheckpointSerializer(), 404: "Not found"})
+    def retrieve(self, request, pk=None):
+        try:
+            missedCheckpoint = self.get_object()
+        except Http404:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return self.conditional_response(self.get_object_validators(missedCheckpoint),
+                                         lambda: Response(self.get_serializer(missedCheckpoint).data))
+
+
+class ComplianceRollupViewSet(SparseFieldsetMixin, TenantScopedMixin, ConditionalGetMixin,
+                              viewsets.ReadOnlyModelViewSet):
+    queryset = ComplianceRollup.objects.all()
+    serializer_class = ComplianceRollupSerializer
+    filter_backends = [ComplianceRollupFilterBackend]
+
+    permission_classes = [IsAuthenticated, DjangoObjectPermissions]
+    basename = 'complianceRollup'
+
+    @swagger_auto_schema(
+        operation_summary="Get the compliance rollups",
+        operation_description="Returns the planned, checked, late and missed checkpoint counts per zone and day. "
+                              "Can be filtered by zone, site, enterprise and from/to (day); with group=site or "
+                              "group=enterprise (or zone) the counts are summed per day and group",
+        manual_parameters=FIELDSET_PARAMETERS + [
+            openapi.Parameter('group', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=sorted(COMPLIANCE_GROUPS))],
+        responses={200: ComplianceRollupSerializer(many=True), 400: "Bad request"})
+    def list(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        group = request.query_params.get('group')
+        if group and group not in COMPLIANCE_GROUPS:
+            return Response({'group': f"One of {', '.join(sorted(COMPLIANCE_GROUPS))} is expected."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return self.conditional_response(self.get_list_validators(queryset),
+                                         lambda: Response(self.get_compliance_data(queryset, group)))
+
+    def get_compliance_data(self, queryset, group):
+        if not group:
+            return self.get_serializer(queryset.order_by('day', 'zone_id'), many=True).data
+        totals = queryset.values('day', group=F(COMPLIANCE_GROUPS[group])).annotate(
+            planned=Sum('planned'), checked=Sum('checked'), late=Sum('late'), missed=Sum('missed'),
+        ).order_by('day', 'group')
+        return ComplianceTotalSerializer(totals, many=True).data
+
+    @swagger_auto_schema(
+        operation_summary="Get a single compliance rollup",
+        operation_description="Returns the checkpoint counts of a zone for one day",
+        manual_parameters=FIELDSET_PARAMETERS,
+        responses={200: ComplianceRollupSerializer(), 404: "Not found"})
+    def retrieve(self, request, pk=None):
+        try:
+            rollup = self.get_object()
+        except Http404:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return self.conditional_response(self.get_object_validators(rollup),
+                                         lambda: Response(self.get_serializer(rollup).data))
+
+
+class AudioUploadViewSet(SparseFieldsetMixin, TenantScopedMixin, ConditionalGetMixin, viewsets.GenericViewSet):
+    queryset = AudioUpload.objects.all()
+    serializer_class = AudioUploadSerializer
+
+    permission_classes = [IsAuthenticated, DjangoObjectPermissions]
+    basename = 'audioUpload'
+
+    @swagger_auto_schema(
+        operation_summary="Start a voice memo upload",
+        operation_description="Declares the memo of a patrolLog with its total size, then send its content "
+                              "with PUT chunk/ starting at offset 0",
+        request_body=AudioUploadSerializer,
+        responses={201: AudioUploadSerializer, 400: "Bad request"})
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers={'Upload-Offset': str(serializer.instance.offset)})
+
+    @swagger_auto_schema(
+        operation_summary="Get a voice memo upload",
+        operation_description="Returns the upload with the offset to resume from",
+        manual_parameters=FIELDSET_PARAMETERS,
+        responses={200: AudioUploadSerializer(), 404: "Not found"})
+    def retrieve(self, request, pk=None):
+        try:
+            upload = self.get_object()
+        except Http404:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return self.conditional_response(
+            self.get_object_validators(upload),
+            lambda: Response(self.get_serializer(upload).data, headers={'Upload-Offset': str(upload.offset)}))
+
+    @swagger_auto_schema(
+        operation_summary="Send a chunk of a voice memo",
+        operation_description="Appends the raw request body (application/octet-stream) to the upload. The "
+                              "Upload-Offset header must be the offset returned by the previous chunk; after "
+                              "an error, GET the upload and resume from its offset. The memo is linked to the "
+                              "patrolLog once its last byte is received; a memo that is not an AAC, M4A, MP3, "
+                              "Ogg or WAV file is refused and the upload deleted",
+        manual_parameters=[openapi.Parameter('Upload-Offset', openapi.IN_HEADER, type=openapi.TYPE_INTEGER,
+                                             required=True)],
+        responses={200: AudioUploadSerializer, 400: "Bad request", 404: "Not found",
+                   409: "Wrong offset, upload already complete or receiving another chunk",
+                   413: "More bytes than the declared size", 415: "The memo is not a supported audio file"})
+    @action(detail=True, methods=['put'], url_path='chunk')
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'Upload-Offset': 'A numeric offset header is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = append_chunk(upload.pk, offset, request.stream)
+        except UploadError as error:
+            return Response({'code': error.code, 'detail': error.message, 'offset': error.offset},
+                            status=UPLOAD_ERROR_STATUS[error.code], headers={'Upload-Offset': str(error.offset)})
+        return Response(self.get_serializer(upload).data, headers={'Upload-Offset': str(upload.offset)})
+
+    @swagger_auto_schema(
+        operation_summary="Cancel a voice memo upload",
+        operation_description="Deletes the upload and the chunks received so far",
+        responses={204: "No content", 404: "Not found"})
+    def destroy(self, request, pk=None):
+        discard_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 # Registration
@@ -343,3 +674,6 @@ router.register('tags', TagViewSet)
 router.register('patrol-logs', PatrolLogViewSet)
 router.register('plannings', PlanningViewSet)
 router.register('zones', ZoneViewSet)
+router.register('missed-checkpoints', MissedCheckpointViewSet)
+router.register('compliance', ComplianceRollupViewSet)
+router.register('audio-uploads', AudioUploadViewSet)
@@ -0,0 +1,66 @@
+"""
+Archival of old patrol logs.
+
+PatrolLog rows planned before the archive age are moved, chunk by chunk, to the
+ArchivedPatrolLog table, so the hot table and its indexes only hold recent history.
+Each chunk is copied and deleted in its own short transaction. The readers (list,
+export, compliance rollups) add the archive to their query only when the requested
+period starts before the newest archived row.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from core.models import ArchivedPatrolLog, PatrolLog
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER = datetime.timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365))
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_BOUNDARY_CACHE_KEY = 'core:archive-boundary'
+# Other processes see a new boundary after at most this many seconds
+ARCHIVE_BOUNDARY_TTL = 60
+
+ARCHIVED_FIELDS = ('id', 'tag_id', 'site_id', 'audio_path', 'image_path', 'image_thumbnail', 'description_anomaly',
+                   'is_checked', 'check_datetime', 'check_tolerance', 'checked_datetime', 'checked_by_id',
+                   'planning_id', 'due_datetime', 'created', 'modified')
+
+
+def get_archive_boundary():
+    """Return the check_datetime of the newest archived row, None when the archive is empty."""
+    boundary = cache.get(ARCHIVE_BOUNDARY_CACHE_KEY)
+    if boundary is None:
+        boundary = (ArchivedPatrolLog.objects.aggregate(last=Max('check_datetime'))['last'],)
+        cache.set(ARCHIVE_BOUNDARY_CACHE_KEY, boundary, ARCHIVE_BOUNDARY_TTL)
+    return boundary[0]
+
+
+def archive_covers(start):
+    """Tell whether rows planned on or after `start` (None: since ever) may be archived."""
+    boundary = get_archive_boundary()
+    return boundary is not None and (start is None or start <= boundary)
+
+
+def archive_patrol_logs(before=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Move the patrol logs planned before `before` (default: now - ARCHIVE_AFTER) to the archive."""
+    before = before or timezone.now() - ARCHIVE_AFTER
+    archived = 0
+    while True:
+        with transaction.atomic():
+            ids = list(PatrolLog.objects.select_for_update().filter(check_datetime__lt=before).order_by(
+                'check_datetime', 'id').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            rows = PatrolLog.objects.filter(pk__in=ids).values(
+                *ARCHIVED_FIELDS, missed_datetime=F('missed__detected_datetime'))
+            ArchivedPatrolLog.objects.bulk_create([ArchivedPatrolLog(**row) for row in rows], ignore_conflicts=True)
+            PatrolLog.objects.filter(pk__in=ids).delete()
+        archived += len(ids)
+        cache.delete(ARCHIVE_BOUNDARY_CACHE_KEY)
+    logger.info('%s patrol logs planned before %s archived', archived, before)
+    return archived
@@ -0,0 +1,101 @@
+"""
+Token authentication backed by the cache.
+
+TokenAuthentication loads the token and its user on every request. CachedTokenAuthentication
+keeps them in the cache for AUTH_TOKEN_CACHE_TTL seconds, the signals of core.signals
+drop the entries of a user as soon as their token is deleted, the user is saved
+(deactivated, password changed...) or their groups/permissions change. The TTL bounds
+how long a change made without signals (queryset.update(), raw SQL) goes unnoticed.
+The other processes only see these invalidations through a shared cache (see
+core.caching.cache_is_shared), without one tokens are looked up on every request.
+
+Hits and misses are counted in the shared cache, each process adds its counts by
+batches of AUTH_TOKEN_STATS_BATCH.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core.caching import cache_is_shared
+
+AUTH_TOKEN_CACHE_TTL = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+AUTH_TOKEN_STATS_BATCH = getattr(settings, 'AUTH_TOKEN_STATS_BATCH', 100)
+AUTH_TOKEN_STATS_KEYS = {
+    'hits': 'core:auth-token:hits',
+    'misses': 'core:auth-token:misses',
+}
+
+
+def token_cache_key(key):
+    # The raw token never appears in the cache keys
+    return 'core:auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user_ids):
+    invalidate_tokens(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+class TokenCacheStats:
+    """Hit/miss counters of the token cache, added to the shared counters by batches."""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            if sum(self._pending.values()) < self.batch:
+                return
+            pending, self._pending = self._pending, Counter()
+        self.add(pending)
+
+    @staticmethod
+    def add(counts):
+        for name, count in counts.items():
+            key = AUTH_TOKEN_STATS_KEYS[name]
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.set(key, count, None)
+
+    @staticmethod
+    def get():
+        counts = cache.get_many(AUTH_TOKEN_STATS_KEYS.values())
+        return {name: counts.get(key, 0) for name, key in AUTH_TOKEN_STATS_KEYS.items()}
+
+    @staticmethod
+    def reset():
+        cache.delete_many(AUTH_TOKEN_STATS_KEYS.values())
+
+
+token_cache_stats = TokenCacheStats(AUTH_TOKEN_STATS_BATCH)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        if not cache_is_shared():
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is not None and token.user.is_active:
+            token_cache_stats.record('hits')
+            return token.user, token
+
+        token_cache_stats.record('misses')
+        user, token = super().authenticate_credentials(key)
+        # Cached before any permission check, so no permission cache of the user goes with it
+        cache.set(cache_key, token, AUTH_TOKEN_CACHE_TTL)
+        return user, token
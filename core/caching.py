@@ -0,0 +1,129 @@
+"""
+Versioned read-through cache of the reference data API (enterprises, sites, zones...).
+
+Every cached model has a version counter in the cache, bumped by the save/delete
+signals of core.signals. Responses are cached under a key holding the versions of the
+models they are built from, so a change makes the stale entries unreachable at once and
+a warm cache answers without any query.
+
+The version counters only reach the other processes through a cache they share
+(Memcached, see MEMCACHED_LOCATION in the settings). With a cache local to each process,
+the caches kept across requests (this one, the permissions, tokens and tenant scopes) are
+not used, see cache_is_shared().
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from core.conditional import ConditionalGetMixin
+
+REFERENCE_CACHE_TTL = getattr(settings, 'REFERENCE_CACHE_TTL', 24 * 60 * 60)
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def cache_is_shared():
+    """Tell whether every process uses the same default cache, the CACHE_SHARED setting forces the answer."""
+    shared = getattr(settings, 'CACHE_SHARED', None)
+    if shared is None:
+        return not isinstance(caches[DEFAULT_CACHE_ALIAS], LOCAL_CACHE_BACKENDS)
+    return shared
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process, the reference data, permissions, API tokens and '
+        'tenant scopes are not cached across requests.',
+        hint='Set MEMCACHED_LOCATION (or CACHES) to a cache shared by every process.',
+        id='core.W001')]
+
+
+def model_version_key(model):
+    return f'core:model-version:{model._meta.label_lower}'
+
+
+def bump_model_version(model):
+    try:
+        cache.incr(model_version_key(model))
+    except ValueError:
+        # A lost counter restarts from the clock, never from a value already used
+        cache.set(model_version_key(model), time.time_ns(), None)
+
+
+def get_model_versions(models):
+    keys = [model_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def related_models(model, paths):
+    """Return the models reached from `model` through the select_related `paths`."""
+    models = []
+    for path in paths:
+        related = model
+        for attr in path.split('__'):
+            related = related._meta.get_field(attr).related_model
+        models.append(related)
+    return models
+
+
+class VersionedCacheMixin(ConditionalGetMixin):
+    """
+    Cache the serialized list/retrieve data of a read-only viewset, together with what
+    its conditional GET validators are built from.
+
+    `cache_models` lists the models the serialized data is built from (default: the
+    model of the queryset), the models of the serialized relations are added to them.
+    """
+    cache_models = None
+
+    def get_cache_key(self, *parts):
+        models = (self.cache_models or [self.queryset.model]) + related_models(self.queryset.model,
+                                                                                self.get_related_paths())
+        versions = '.'.join(str(version) for version in get_model_versions(models))
+        # The serialized data depends on the tenants of the user and on the renderer
+        representation = f'{self.get_scope_key()}:{self.request.accepted_media_type}?' \
+                         f'{self.request.query_params.urlencode()}'
+        query = hashlib.md5(representation.encode()).hexdigest()
+        return ':'.join(['core:api', self.basename, versions, query] + [str(part) for part in parts])
+
+    def get_scope_key(self):
+        """The data visible to the user of the request, see core.tenancy."""
+        return 'all'
+
+    def get_cached_list(self):
+        """Return the serialized list and its Validators."""
+        key = self.get_cache_key('list') if cache_is_shared() else None
+        cached = cache.get(key) if key else None
+        if cached is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            cached = (self.get_serializer(queryset, many=True).data, self.get_list_stats(queryset))
+            if key:
+                cache.set(key, cached, REFERENCE_CACHE_TTL)
+        data, stats = cached
+        return data, self.make_validators(*stats)
+
+    def get_cached_object(self, pk):
+        """Return the serialized object and its Validators, raise Http404 when it does not exist."""
+        key = self.get_cache_key('detail', pk) if cache_is_shared() else None
+        cached = cache.get(key) if key else None
+        if cached is None:
+            obj = self.get_object()
+            cached = (self.get_serializer(obj).data, (self.get_last_modified(obj), obj.pk))
+            if key:
+                cache.set(key, cached, REFERENCE_CACHE_TTL)
+        else:
+            # Object permission backends only need the primary key
+            self.check_object_permissions(self.request, self.get_queryset().model(pk=pk))
+        data, stats = cached
+        return data, self.make_object_validators(*stats)
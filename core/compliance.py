@@ -0,0 +1,168 @@
+"""
+Compliance rollups: planned / checked / late / missed checkpoints per zone and day.
+
+The writers of PatrolLog (generation, scans, missed detection, API saves) report the
+(zone, day) buckets they touched and only those buckets are recomputed, with one
+grouped query on the (tag, check_datetime) index. The recount runs once the writer has
+committed, in its own transaction holding the lock of the bucket rows, so concurrent
+writers of a bucket are counted one after the other and a failed recount never rolls
+back the write. `rebuild_rollups` recomputes a whole period, month by month.
+"""
+import datetime
+import logging
+
+from django.db import DatabaseError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.archive import archive_covers
+from core.models import ArchivedPatrolLog, ComplianceRollup, PatrolLog, Zone
+
+BULK_BATCH_SIZE = 500
+COUNTERS = ('planned', 'checked', 'late', 'missed')
+
+logger = logging.getLogger(__name__)
+
+
+def local_day(value):
+    return timezone.localdate(value)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+
+
+def count_checkpoints(filters, now):
+    """
+    Group the patrol logs matching `filters` by (zone, local day), archived ones included
+    when the period reaches the archive, and return {(zone_id, day): {counter: value}}.
+    """
+    querysets = [PatrolLog.objects.filter(**filters)]
+    if archive_covers(filters['check_datetime__gte']):
+        querysets.append(ArchivedPatrolLog.objects.filter(**filters))
+    counts = {}
+    for queryset in querysets:
+        rows = queryset.annotate(day=TruncDate('check_datetime')).values('tag__zone_id', 'day').annotate(
+            planned=Count('id'),
+            checked=Count('id', filter=Q(is_checked=True)),
+            late=Count('id', filter=Q(is_checked=True, checked_datetime__gt=F('due_datetime'))),
+            missed=Count('id', filter=Q(is_checked=False, due_datetime__lt=now)),
+        ).order_by()
+        for row in rows:
+            totals = counts.setdefault((row['tag__zone_id'], row['day']), dict.fromkeys(COUNTERS, 0))
+            for name in COUNTERS:
+                totals[name] += row[name]
+    return counts
+
+
+def tag_rollup_keys(tag):
+    """The (zone_id, day) buckets counting the live or archived checkpoints of `tag`."""
+    days = set()
+    for model in (PatrolLog, ArchivedPatrolLog):
+        days.update(model.objects.filter(tag=tag).annotate(day=TruncDate('check_datetime'))
+                    .values_list('day', flat=True).order_by().distinct())
+    return {(tag.zone_id, day) for day in days}
+
+
+def get_zones(zone_ids):
+    return {pk: (site_id, enterprise_id) for pk, site_id, enterprise_id in
+            Zone.objects.filter(pk__in=zone_ids).values_list('pk', 'site_id', 'site__enterprise_id')}
+
+
+def update_rollups(counts, rollups, now):
+    """Write the counters of the `rollups` rows, buckets absent from `counts` are reset to zero."""
+    to_update = []
+    for key, rollup in rollups.items():
+        values = counts.get(key, dict.fromkeys(COUNTERS, 0))
+        if any(getattr(rollup, name) != value for name, value in values.items()):
+            for name, value in values.items():
+                setattr(rollup, name, value)
+            rollup.modified = now
+            to_update.append(rollup)
+    ComplianceRollup.objects.bulk_update(to_update, COUNTERS + ('modified',), batch_size=BULK_BATCH_SIZE)
+
+
+def save_rollups(counts, keys):
+    """Write the counters of `keys`, buckets absent from `counts` are reset to zero."""
+    zones = get_zones({zone_id for zone_id, _ in keys})
+    existing = {(rollup.zone_id, rollup.day): rollup for rollup in ComplianceRollup.objects.filter(
+        zone_id__in=zones, day__in={day for _, day in keys})}
+    to_create = []
+    for key in keys:
+        values = counts.get(key, dict.fromkeys(COUNTERS, 0))
+        if key[0] in zones and key not in existing and any(values.values()):
+            site_id, enterprise_id = zones[key[0]]
+            to_create.append(ComplianceRollup(zone_id=key[0], day=key[1], site_id=site_id,
+                                              enterprise_id=enterprise_id, **values))
+    ComplianceRollup.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+    update_rollups(counts, {key: rollup for key, rollup in existing.items() if key in keys}, timezone.now())
+
+
+def lock_rollups(keys):
+    """
+    Return the rollup rows of `keys` locked for update, the missing rows being created
+    first. Rows are always locked in (zone, day) order, so concurrent refreshes queue up
+    instead of deadlocking.
+    """
+    zones = get_zones({zone_id for zone_id, _ in keys})
+    keys = sorted(key for key in keys if key[0] in zones)
+    ComplianceRollup.objects.bulk_create(
+        [ComplianceRollup(zone_id=zone_id, day=day, site_id=zones[zone_id][0], enterprise_id=zones[zone_id][1])
+         for zone_id, day in keys], batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+    rows = ComplianceRollup.objects.select_for_update().filter(
+        zone_id__in=zones, day__in={day for _, day in keys}).order_by('zone_id', 'day')
+    keys = set(keys)
+    return {(rollup.zone_id, rollup.day): rollup for rollup in rows if (rollup.zone_id, rollup.day) in keys}
+
+
+def refresh_rollups(keys, now=None):
+    """Recompute the (zone_id, day) buckets in `keys` once the current transaction is committed."""
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: refresh_locked_rollups(keys, now))
+
+
+def refresh_locked_rollups(keys, now=None):
+    """
+    Recompute the buckets in `keys` under the lock of their rows. A failure is only
+    logged: the next write of the bucket or `rebuild_rollups` brings it up to date.
+    """
+    now = now or timezone.now()
+    days = [day for _, day in keys]
+    try:
+        with transaction.atomic():
+            rollups = lock_rollups(keys)
+            if not rollups:
+                return
+            counts = count_checkpoints({
+                'tag__zone_id__in': {zone_id for zone_id, _ in keys},
+                'check_datetime__gte': day_start(min(days)),
+                'check_datetime__lt': day_start(max(days) + datetime.timedelta(days=1)),
+            }, now)
+            update_rollups(counts, rollups, timezone.now())
+    except DatabaseError:
+        logger.exception('Refresh of the compliance rollups of %s buckets failed', len(keys))
+
+
+def refresh_zone_rollups(zone_ids, start_day, end_day, now=None):
+    """Recompute every bucket of the zones between `start_day` and `end_day` (excluded)."""
+    days = [start_day + datetime.timedelta(days=offset) for offset in range((end_day - start_day).days)]
+    refresh_rollups(((zone_id, day) for zone_id in zone_ids for day in days), now)
+
+
+def rebuild_rollups(start_day, end_day, now=None):
+    """Recompute all the rollups between `start_day` and `end_day` (excluded), one month at a time."""
+    now = now or timezone.now()
+    month = start_day.replace(day=1)
+    while month < end_day:
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        period_start, period_end = max(month, start_day), min(next_month, end_day)
+        counts = count_checkpoints({
+            'check_datetime__gte': day_start(period_start),
+            'check_datetime__lt': day_start(period_end),
+        }, now)
+        with transaction.atomic():
+            ComplianceRollup.objects.filter(day__gte=period_start, day__lt=period_end).delete()
+            save_rollups(counts, counts.keys())
+        month = next_month
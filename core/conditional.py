@@ -0,0 +1,77 @@
+"""
+Conditional GET for the REST API.
+
+Lists are validated by an ETag built from the row count and the latest `modified` of the
+filtered queryset (or from the rows of the current page for the paginated endpoints),
+single objects by their own `modified`, the relations serialized with the rows included.
+Only single objects send a Last-Modified: the latest `modified` of a list does not change
+when a row is deleted. A request whose If-None-Match/If-Modified-Since matches gets a 304
+before anything is serialized.
+"""
+import hashlib
+from collections import namedtuple
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+Validators = namedtuple('Validators', ['etag', 'last_modified'])
+
+
+class ConditionalGetMixin:
+
+    def make_validators(self, count, last_modified, *parts):
+        """Build the ETag from the row count, the latest modification and the representation asked."""
+        representation = (self.basename, self.action, self.request.accepted_media_type,
+                          self.request.query_params.urlencode())
+        parts = representation + (count, last_modified.isoformat() if last_modified else None) + parts
+        content = ':'.join(str(part) for part in parts)
+        return Validators('"%s"' % hashlib.md5(content.encode()).hexdigest(), None)
+
+    def make_object_validators(self, last_modified, pk):
+        """Build the ETag and Last-Modified of a single object."""
+        validators = self.make_validators(1, last_modified, pk)
+        return validators._replace(last_modified=int(last_modified.timestamp()) if last_modified else None)
+
+    def get_related_paths(self):
+        """The relations serialized with each row, their changes also change the validators."""
+        return ()
+
+    def get_list_stats(self, queryset):
+        paths = ['modified'] + [f'{path}__modified' for path in self.get_related_paths()]
+        stats = queryset.order_by().aggregate(count=Count('pk'), **{f'last{index}': Max(path)
+                                                                    for index, path in enumerate(paths)})
+        count = stats.pop('count')
+        return count, max((value for value in stats.values() if value is not None), default=None)
+
+    def get_list_validators(self, queryset):
+        return self.make_validators(*self.get_list_stats(queryset))
+
+    def get_page_validators(self, page):
+        return self.make_validators(len(page), max((self.get_last_modified(row) for row in page), default=None),
+                                    *(row.pk for row in page))
+
+    def get_object_validators(self, obj):
+        return self.make_object_validators(self.get_last_modified(obj), obj.pk)
+
+    def get_last_modified(self, obj):
+        values = [obj.modified]
+        for path in self.get_related_paths():
+            related = obj
+            for attr in path.split('__'):
+                related = getattr(related, attr, None)
+            if related is not None and getattr(related, 'modified', None) is not None:
+                values.append(related.modified)
+        return max(values)
+
+    def conditional_response(self, validators, build_response):
+        """Return a 304 when the request matches `validators`, the response of `build_response()` otherwise."""
+        response = get_conditional_response(self.request, etag=validators.etag,
+                                            last_modified=validators.last_modified)
+        if response is None:
+            response = build_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = validators.etag
+            if validators.last_modified is not None:
+                response['Last-Modified'] = http_date(validators.last_modified)
+        return response
@@ -0,0 +1,143 @@
+"""
+Real-time detection of missed checkpoints.
+
+A long-running worker keeps the upcoming deadlines (PatrolLog.due_datetime) of the
+unchecked checkpoints in a heap and wakes up exactly when the earliest one expires.
+The heap is fed by the PatrolLog/replanning signals of the process it runs in and, for
+the changes made by other processes, by a cheap query on the rows modified since the
+last refresh. That query looks `lag` further back than the newest change it saw: the
+bulk writers stamp `modified` when their transaction starts, so their rows may be
+committed after rows with a later `modified` were read. Entries are checked against the database when they expire, so a
+checkpoint scanned or deleted in the meantime never raises an alert.
+"""
+import datetime
+import heapq
+import logging
+import threading
+import weakref
+
+from django.db.models import Max
+from django.dispatch import Signal
+from django.utils import timezone
+
+from core.compliance import local_day, refresh_rollups
+from core.models import MissedCheckpoint, PatrolLog
+
+logger = logging.getLogger(__name__)
+
+# Sent with `missed`: the MissedCheckpoint recorded when deadlines expired
+checkpoint_missed = Signal()
+
+# Queues running in this process, updated by core.signals
+active_queues = weakref.WeakSet()
+
+
+class DeadlineQueue:
+    """Heap of (due_datetime, patrol_log id) of the unchecked checkpoints due within `horizon`."""
+
+    def __init__(self, horizon=datetime.timedelta(hours=6), lag=datetime.timedelta(minutes=5)):
+        self.horizon = horizon
+        # Longer than the longest transaction writing PatrolLog rows
+        self.lag = lag
+        self.loaded_until = None
+        self.watermark = None
+        self._heap = []
+        self._queued = {}
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def push(self, pk, due_datetime):
+        """Add or move the deadline of a checkpoint, ignored past the loaded horizon."""
+        if due_datetime is None or self.loaded_until is None or due_datetime > self.loaded_until:
+            return
+        with self._condition:
+            if self._queued.get(pk) == due_datetime:
+                return
+            self._queued[pk] = due_datetime
+            heapq.heappush(self._heap, (due_datetime, pk))
+            self._condition.notify()
+
+    def discard(self, pk):
+        with self._condition:
+            self._queued.pop(pk, None)
+
+    def push_zones(self, zone_ids, now=None):
+        """Reload the deadlines of the given zones, after they were replanned."""
+        if self.loaded_until is None:
+            return
+        now = now or timezone.now()
+        rows = PatrolLog.objects.filter(
+            tag__zone_id__in=zone_ids, is_checked=False, due_datetime__gt=now, due_datetime__lte=self.loaded_until,
+        ).values_list('pk', 'due_datetime')
+        for pk, due_datetime in rows:
+            self.push(pk, due_datetime)
+
+    def load(self, now=None):
+        """Fill the heap with the deadlines between now (or the loaded horizon) and now + horizon."""
+        now = now or timezone.now()
+        start = max(self.loaded_until or now, now)
+        until = now + self.horizon
+        rows = PatrolLog.objects.filter(
+            is_checked=False, due_datetime__gt=start, due_datetime__lte=until,
+        ).values_list('pk', 'due_datetime')
+        if self.watermark is None:
+            self.watermark = PatrolLog.objects.aggregate(last=Max('modified'))['last'] or now
+        self.loaded_until = until
+        for pk, due_datetime in rows:
+            self.push(pk, due_datetime)
+
+    def refresh(self, now=None):
+        """Pick the checkpoints created or changed by other processes and extend the horizon."""
+        now = now or timezone.now()
+        # The rows seen by the previous refreshes are seen again, pushing them twice changes nothing
+        changed = PatrolLog.objects.filter(modified__gt=self.watermark - self.lag).values_list(
+            'pk', 'due_datetime', 'is_checked', 'modified')
+        for pk, due_datetime, is_checked, modified in changed:
+            self.watermark = max(self.watermark, modified)
+            if is_checked:
+                self.discard(pk)
+            elif due_datetime is not None and due_datetime > now:
+                self.push(pk, due_datetime)
+        if self.loaded_until - now < self.horizon / 2:
+            self.load(now)
+
+    def pop_expired(self, now):
+        """Remove and return the ids of the checkpoints due at or before `now`."""
+        expired = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due_datetime, pk = heapq.heappop(self._heap)
+                if self._queued.get(pk) == due_datetime:
+                    del self._queued[pk]
+                    expired.append(pk)
+        return expired
+
+    def wait(self, timeout, now=None):
+        """Sleep until the next deadline, a push or `timeout` seconds, whichever comes first."""
+        now = now or timezone.now()
+        with self._condition:
+            if self._heap:
+                timeout = min(timeout, max((self._heap[0][0] - now).total_seconds(), 0))
+            if timeout > 0:
+                self._condition.wait(timeout)
+
+
+def record_missed(pks, now=None):
+    """Record the expired checkpoints still unchecked as missed and send `checkpoint_missed`."""
+    now = now or timezone.now()
+    overdue = PatrolLog.objects.filter(pk__in=pks, is_checked=False, due_datetime__lte=now).values_list(
+        'pk', 'site_id', 'due_datetime', 'tag__zone_id', 'check_datetime')
+    missed = []
+    rollup_keys = set()
+    for pk, site_id, due_datetime, zone_id, check_datetime in overdue:
+        missed.append(MissedCheckpoint(patrol_log_id=pk, site_id=site_id, due_datetime=due_datetime,
+                                       detected_datetime=now))
+        rollup_keys.add((zone_id, local_day(check_datetime)))
+    if missed:
+        MissedCheckpoint.objects.bulk_create(missed, ignore_conflicts=True)
+        refresh_rollups(rollup_keys, now)
+        logger.warning('%s checkpoints missed: %s', len(missed), [row.patrol_log_id for row in missed])
+        checkpoint_missed.send(sender=MissedCheckpoint, missed=missed)
+    return missed
@@ -0,0 +1,91 @@
+"""
+Streaming exports of patrol logs.
+
+Rows are read with a chunked server-side iterator on plain values and written one by one
+into a StreamingHttpResponse, so memory use does not depend on the size of the export.
+Several querysets (hot and archived rows) are merged on the fly in check_datetime order.
+"""
+import csv
+import datetime
+import heapq
+import json
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.duration import duration_string
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (column name, ORM path)
+PATROL_LOG_COLUMNS = (
+    ('id', 'id'),
+    ('tag', 'tag_id'),
+    ('tag__designation', 'tag__designation'),
+    ('tag__order', 'tag__order'),
+    ('zone_id', 'tag__zone_id'),
+    ('zone__designation', 'tag__zone__designation'),
+    ('check_datetime', 'check_datetime'),
+    ('check_tolerance', 'check_tolerance'),
+    ('is_checked', 'is_checked'),
+    ('checked_datetime', 'checked_datetime'),
+    ('checked_by', 'checked_by_id'),
+    ('description_anomaly', 'description_anomaly'),
+    ('audio_path', 'audio_path'),
+    ('image_path', 'image_path'),
+    ('image_thumbnail', 'image_thumbnail'),
+    ('created', 'created'),
+    ('modified', 'modified'),
+)
+
+
+class Echo:
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return duration_string(value)
+    return value
+
+
+def export_rows(querysets, columns):
+    paths = [path for _, path in columns]
+    rows = [queryset.order_by('check_datetime', 'id').values_list(*paths).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+            for queryset in querysets]
+    if len(rows) == 1:
+        return rows[0]
+    date_index, id_index = paths.index('check_datetime'), paths.index('id')
+    return heapq.merge(*rows, key=lambda row: (row[date_index], row[id_index]))
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for row in rows:
+        yield writer.writerow(['' if value is None else format_value(value) for value in row])
+
+
+def stream_ndjson(rows, columns):
+    names = [name for name, _ in columns]
+    for row in rows:
+        yield json.dumps({name: format_value(value) for name, value in zip(names, row)}) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
+
+
+def export_response(querysets, export_format, name, columns=PATROL_LOG_COLUMNS):
+    """Return a StreamingHttpResponse with the rows of `querysets` as an attachment."""
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(export_rows(querysets, columns), columns), content_type=content_type)
+    filename = f'{name}-{timezone.localdate():%Y%m%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
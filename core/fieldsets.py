@@ -0,0 +1,148 @@
+"""
+Sparse fieldsets (?fields=) and embedded relations (?expand=) for the REST API.
+
+DynamicFieldsMixin drops the fields a client did not ask for and replaces the
+expanded foreign keys by their nested representation. SparseFieldsetMixin then reads
+the fields left in the serializer to load exactly the columns they need, with one
+select_related join per relation instead of a query per row.
+"""
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+QueryPlan = namedtuple('QueryPlan', ['only', 'related'])
+
+
+def parse_list_param(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin reading `fields` and `expand` from the query parameters of the
+    request, or from its keyword arguments when nested. Only read requests are affected:
+    a write validates and saves every field whatever its query parameters.
+
+    `expandable_fields` maps a field name to the serializer class of its expanded form;
+    `expand` takes dotted paths (expand=tag.zone) to expand nested serializers as well.
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            request = self.context.get('request')
+            params = request.query_params if request is not None and request.method in SAFE_METHODS else {}
+            fields = parse_list_param(params.get('fields'))
+            expand = parse_list_param(params.get('expand'))
+
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        nested = {}
+        for path in expand:
+            name, _, rest = path.partition('.')
+            nested.setdefault(name, [])
+            if rest:
+                nested[name].append(rest)
+        for name, sub_expand in nested.items():
+            if name in self.fields and name in self.expandable_fields:
+                source = self.fields[name].source
+                kwargs = {'source': source} if source != name else {}
+                self.fields[name] = self.expandable_fields[name](read_only=True, expand=sub_expand, **kwargs)
+
+
+def resolve_path(model, attrs):
+    """Return the model fields of a serializer source path, None when it is not made of concrete fields."""
+    resolved = []
+    for index, attr in enumerate(attrs):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        if field.auto_created and not field.concrete:
+            return None
+        resolved.append(field)
+        if index < len(attrs) - 1:
+            if not (field.many_to_one or field.one_to_one):
+                return None
+            model = field.related_model
+    return resolved
+
+
+def get_query_plan(serializer, model):
+    """
+    Return the columns (`only`, None when they cannot all be resolved) and the
+    select_related paths needed to serialize `model` rows with `serializer`.
+    """
+    only, related = {'modified'} if has_modified(model) else set(), set()
+    complete = collect_columns(serializer, model, '', only, related)
+    return QueryPlan(sorted(only) if complete else None, sorted(related))
+
+
+def collect_columns(serializer, model, prefix, only, related):
+    complete = True
+    for field in serializer.fields.values():
+        if isinstance(field, (serializers.SerializerMethodField, serializers.HiddenField)):
+            continue
+        resolved = resolve_path(model, field.source_attrs) if field.source != '*' else None
+        if resolved is None:
+            complete = False
+            continue
+        for depth, relation in enumerate(resolved[:-1], start=1):
+            add_relation(prefix + '__'.join(field.source_attrs[:depth]), relation.related_model, only, related)
+        path = prefix + '__'.join(field.source_attrs)
+        if isinstance(field, serializers.BaseSerializer):
+            last = resolved[-1]
+            if isinstance(field, serializers.ListSerializer) or not (last.many_to_one or last.one_to_one):
+                complete = False
+                continue
+            add_relation(path, last.related_model, only, related)
+            complete = collect_columns(field, last.related_model, path + '__', only, related) and complete
+        else:
+            only.add(path)
+    return complete
+
+
+def add_relation(path, model, only, related):
+    related.add(path)
+    if has_modified(model):
+        only.add(f'{path}__modified')
+
+
+def has_modified(model):
+    try:
+        model._meta.get_field('modified')
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin loading only the columns and relations the serializer of the request
+    reads. The `modified` columns are always loaded, the conditional GET validators use
+    them, and so is the ordering key of the paginator, which builds the cursors from it.
+    """
+
+    def get_query_plan(self):
+        if not hasattr(self, '_query_plan'):
+            self._query_plan = get_query_plan(self.get_serializer(), self.queryset.model)
+        return self._query_plan
+
+    def get_related_paths(self):
+        return self.get_query_plan().related
+
+    def optimize_queryset(self, queryset):
+        plan = self.get_query_plan()
+        if plan.related:
+            queryset = queryset.select_related(*plan.related)
+        # Rows loaded to be saved back keep all their columns
+        if plan.only is not None and self.request.method in SAFE_METHODS:
+            queryset = queryset.only(*plan.only, *getattr(self.pagination_class, 'ordering', ()))
+        return queryset
+
+    def get_queryset(self):
+        return self.optimize_queryset(super().get_queryset())
@@ -0,0 +1,126 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+class PatrolLogFilterBackend(BaseFilterBackend):
+    """
+    Filter patrol logs on the query parameters below, each one backed by a
+    (column, check_datetime) index of PatrolLog.
+
+    zone, site, employee: ids; from, to: check_datetime bounds (datetime or date,
+    `to` being exclusive); is_checked: true/false.
+    """
+    id_params = {
+        'zone': 'tag__zone_id',
+        'site': 'site_id',
+        'employee': 'checked_by_id',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        for param, lookup in self.id_params.items():
+            if params.get(param):
+                filters[lookup] = self.parse_id(param, params[param])
+        if params.get('from'):
+            filters['check_datetime__gte'] = self.parse_datetime('from', params['from'])
+        if params.get('to'):
+            filters['check_datetime__lt'] = self.parse_datetime('to', params['to'])
+        if params.get('is_checked'):
+            filters['is_checked'] = self.parse_bool('is_checked', params['is_checked'])
+        return queryset.filter(**filters)
+
+    @staticmethod
+    def parse_id(param, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({param: 'A numeric id is expected.'})
+
+    @staticmethod
+    def parse_datetime(param, value):
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                date = parse_date(value)
+                parsed = datetime.datetime.combine(date, datetime.time()) if date else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({param: 'A date (YYYY-MM-DD) or an ISO 8601 datetime is expected.'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    @staticmethod
+    def parse_bool(param, value):
+        if value.lower() in ('1', 'true'):
+            return True
+        if value.lower() in ('0', 'false'):
+            return False
+        raise ValidationError({param: 'true or false is expected.'})
+
+    def get_schema_operation_parameters(self, view):
+        descriptions = {
+            'zone': ('integer', 'Zone id'),
+            'site': ('integer', 'Site id'),
+            'employee': ('integer', 'Id of the employee who checked the tag'),
+            'from': ('string', 'Planned on or after this date/datetime'),
+            'to': ('string', 'Planned before this date/datetime'),
+            'is_checked': ('boolean', 'Checked state'),
+        }
+        return [
+            {'name': name, 'required': False, 'in': 'query', 'description': description, 'schema': {'type': kind}}
+            for name, (kind, description) in descriptions.items()
+        ]
+
+
+class ComplianceRollupFilterBackend(BaseFilterBackend):
+    """
+    Filter compliance rollups on zone, site, enterprise (ids) and from, to (days, `to`
+    being exclusive).
+    """
+    id_params = {
+        'zone': 'zone_id',
+        'site': 'site_id',
+        'enterprise': 'enterprise_id',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        for param, lookup in self.id_params.items():
+            if params.get(param):
+                filters[lookup] = PatrolLogFilterBackend.parse_id(param, params[param])
+        if params.get('from'):
+            filters['day__gte'] = self.parse_day('from', params['from'])
+        if params.get('to'):
+            filters['day__lt'] = self.parse_day('to', params['to'])
+        return queryset.filter(**filters)
+
+    @staticmethod
+    def parse_day(param, value):
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({param: 'A date (YYYY-MM-DD) is expected.'})
+        return parsed
+
+    def get_schema_operation_parameters(self, view):
+        descriptions = {
+            'zone': ('integer', 'Zone id'),
+            'site': ('integer', 'Site id'),
+            'enterprise': ('integer', 'Enterprise id'),
+            'from': ('string', 'On or after this date'),
+            'to': ('string', 'Before this date'),
+        }
+        return [
+            {'name': name, 'required': False, 'in': 'query', 'description': description, 'schema': {'type': kind}}
+            for name, (kind, description) in descriptions.items()
+        ]
@@ -11,16 +11,18 @@ from django.views.generic.base import ContextMixin
 from django.db import models
 from django.views.generic.detail import BaseDetailView, SingleObjectTemplateResponseMixin
 
+from core.tenancy import TenantScopedMixin, scope_queryset
 
-class SListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+
+class SListView(LoginRequiredMixin, PermissionRequiredMixin, TenantScopedMixin, ListView):
     pass
 
 
-class SDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
+class SDetailView(LoginRequiredMixin, PermissionRequiredMixin, TenantScopedMixin, DetailView):
     pass
 
 
-class SCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
+class SCreateView(LoginRequiredMixin, PermissionRequiredMixin, TenantScopedMixin, CreateView):
 
     def form_valid(self, form):
         try:
@@ -33,11 +35,11 @@ class SCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
             return self.render_to_response(self.get_context_data(form=form))
 
 
-class SUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
+class SUpdateView(LoginRequiredMixin, PermissionRequiredMixin, TenantScopedMixin, UpdateView):
     pass
 
 
-class SDeleteView(DeleteView):
+class SDeleteView(TenantScopedMixin, DeleteView):
     pass
 
 
@@ -62,7 +64,7 @@ class ParentObjectMixin(ContextMixin):
         # Use a custom queryset if provided; this is required for subclasses
         # like DateDetailView
         if queryset is None:
-            queryset = self.parent_model._default_manager.all()
+            queryset = scope_queryset(self.parent_model._default_manager.all(), self.request.user)
 
         # Next, try looking up by primary key.
         pk = self.kwargs.get(self.parent_pk_url_kwarg)
@@ -115,6 +117,11 @@ class SParentDetailChildCreateView(ParentObjectMixin, SCreateView):
     def get_queryset(self):
         return super().get_queryset().filter(**{self.parent_field: self.get_parent_object()})
 
+    def form_valid(self, form):
+        # Raise a 404 before creating a child of a parent out of the user's tenants
+        self.get_parent_object()
+        return super().form_valid(form)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update(self.get_parent_context_data())
@@ -195,8 +202,8 @@ class BaseDoActionView(DoActionMixin, BaseDetailView):
     """
 
 
-class SDoActionView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, SingleObjectTemplateResponseMixin,
-                    BaseDoActionView):
+class SDoActionView(LoginRequiredMixin, PermissionRequiredMixin, SuccessMessageMixin, TenantScopedMixin,
+                    SingleObjectTemplateResponseMixin, BaseDoActionView):
     """
     View for deleting an object retrieved with self.get_object(), with a
     response rendered by a template.
@@ -0,0 +1,115 @@
+"""
+Processing of the anomaly photos attached to patrol logs.
+
+Uploaded photos are handed to a pool of worker threads, off the request path. Each
+photo is rotated upright, stripped of its metadata (EXIF, GPS...), downscaled and
+re-encoded as JPEG, and a thumbnail is generated. Both files are stored under the
+SHA-256 of their content, so a photo uploaded twice is stored once.
+"""
+import hashlib
+import io
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.models import ArchivedPatrolLog, PatrolLog
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_SIZE = getattr(settings, 'IMAGE_MAX_SIZE', 2048)
+IMAGE_THUMBNAIL_SIZE = getattr(settings, 'IMAGE_THUMBNAIL_SIZE', 320)
+IMAGE_QUALITY = getattr(settings, 'IMAGE_QUALITY', 85)
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+
+PROCESSED_NAME_RE = re.compile(r'^images/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+
+def encode_jpeg(image, max_size):
+    """Return the JPEG bytes of `image` scaled down to fit in max_size x max_size, without metadata."""
+    image = image.copy()
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def process_image(file):
+    """Return the (image, thumbnail) JPEG bytes of the photo in `file`."""
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return encode_jpeg(image, IMAGE_MAX_SIZE), encode_jpeg(image, IMAGE_THUMBNAIL_SIZE)
+
+
+def store_content(content, folder):
+    """Save `content` under its SHA-256 in `folder`, unless the same file is already stored."""
+    digest = hashlib.sha256(content).hexdigest()
+    name = f'{folder}/{digest[:2]}/{digest}.jpg'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def process_patrol_log_image(pk):
+    """Replace the photo of a patrol log by its processed version and set its thumbnail."""
+    patrol_log = PatrolLog.objects.filter(pk=pk).only('image_path', 'image_thumbnail').first()
+    if patrol_log is None or not patrol_log.image_path:
+        return None
+    original = patrol_log.image_path.name
+    if PROCESSED_NAME_RE.match(original) and patrol_log.image_thumbnail:
+        return original
+
+    with patrol_log.image_path.open('rb') as file:
+        image, thumbnail = process_image(file)
+    image_name = store_content(image, 'images')
+    thumbnail_name = store_content(thumbnail, 'images/thumbnails')
+
+    # Only if the photo was not replaced in the meantime; update() keeps the PatrolLog signals quiet
+    updated = PatrolLog.objects.filter(pk=pk, image_path=original).update(
+        image_path=image_name, image_thumbnail=thumbnail_name, modified=timezone.now())
+    if updated and original != image_name and not any(
+            model.objects.filter(image_path=original).exists() for model in (PatrolLog, ArchivedPatrolLog)):
+        default_storage.delete(original)
+    return image_name
+
+
+def run_image_job(pk):
+    """Worker entry point: process one photo, log failures and release the thread's connection."""
+    try:
+        return process_patrol_log_image(pk)
+    except Exception:
+        logger.exception('Processing of the photo of patrol log %s failed', pk)
+    finally:
+        close_old_connections()
+
+
+class ImagePipeline:
+    """Pool of threads processing patrol log photos in the background."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='images')
+            return self._executor
+
+    def submit(self, pk):
+        """Process the photo of the patrol log once the current transaction is committed."""
+        transaction.on_commit(lambda: self.executor.submit(run_image_job, pk))
+
+
+image_pipeline = ImagePipeline(IMAGE_WORKERS)
@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.archive import ARCHIVE_AFTER, ARCHIVE_CHUNK_SIZE, archive_patrol_logs
+
+
+class Command(BaseCommand):
+    help = 'Move the patrol logs older than the archive age to the archive table, in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER.days,
+                            help=f'Archive the patrol logs planned more than this many days ago '
+                                 f'(default: {ARCHIVE_AFTER.days}).')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help=f'Rows moved per transaction (default: {ARCHIVE_CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        archived = archive_patrol_logs(before, chunk_size=options['chunk_size'])
+        self.stdout.write(f'{archived} patrol logs planned before {before:%Y-%m-%d %H:%M} archived')
@@ -0,0 +1,54 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from core.models import PatrolLog
+from core.renderers import MSGPACK_MEDIA_TYPE, MessagePackRenderer
+from core.serializers import PatrolLogSerializer
+
+FORMATS = (
+    ('json', JSONRenderer, 'application/json'),
+    ('msgpack', MessagePackRenderer, MSGPACK_MEDIA_TYPE),
+    ('msgpack columns', MessagePackRenderer, f'{MSGPACK_MEDIA_TYPE}; layout=columns'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare the size and encoding time of a page of patrol logs in JSON and MessagePack.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Patrol logs per page (default: 100).')
+        parser.add_argument('--repeat', type=int, default=20, help='Encodings timed per format (default: 20).')
+
+    def handle(self, *args, **options):
+        patrol_logs = list(PatrolLog.objects.select_related('tag__zone').order_by('-check_datetime')[:options['rows']])
+        if not patrol_logs:
+            raise CommandError('No patrol log to encode.')
+
+        self.stdout.write(f'{len(patrol_logs)} patrol logs, best of {options["repeat"]}')
+        self.stdout.write(f'{"format":<16}{"bytes":>10}{"gzip":>10}{"serialize ms":>14}{"render ms":>11}')
+        for name, renderer_class, media_type in FORMATS:
+            renderer = renderer_class()
+            request = Request(RequestFactory().get('/'))
+            request.accepted_renderer, request.accepted_media_type = renderer, media_type
+
+            context = {'request': request}
+            serialize_time, data = self.timed(
+                options['repeat'], lambda: PatrolLogSerializer(patrol_logs, many=True, context=context).data)
+            render_time, content = self.timed(options['repeat'], lambda: renderer.render(data, media_type))
+            self.stdout.write(f'{name:<16}{len(content):>10}{len(gzip.compress(content)):>10}'
+                              f'{serialize_time * 1000:>14.2f}{render_time * 1000:>11.2f}')
+
+    @staticmethod
+    def timed(repeat, function):
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.scheduling import materialize_checkpoints, reconcile_holidays
+
+
+class Command(BaseCommand):
+    help = ('Reschedule the checkpoints of the zones affected by holiday changes, then generate the checkpoints '
+            'of every validated zone up to N weeks ahead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=4, help='Number of weeks to keep materialized (default: 4).')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Zones handled per transaction.')
+
+    def handle(self, *args, **options):
+        rescheduled = reconcile_holidays()
+        if rescheduled:
+            self.stdout.write(f'{len(rescheduled)} zones rescheduled after holiday changes')
+        result = materialize_checkpoints(options['weeks'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.created} checkpoints generated in {result.duration:.2f}s'
+        ))
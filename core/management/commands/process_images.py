@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.images import IMAGE_WORKERS, run_image_job
+from core.models import PatrolLog
+
+
+class Command(BaseCommand):
+    help = 'Process the patrol log photos not processed yet: strip metadata, downscale and generate thumbnails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=IMAGE_WORKERS,
+                            help=f'Photos processed in parallel (default: {IMAGE_WORKERS}).')
+
+    def handle(self, *args, **options):
+        pks = list(PatrolLog.objects.exclude(Q(image_path__isnull=True) | Q(image_path='')).filter(
+            Q(image_thumbnail__isnull=True) | Q(image_thumbnail='')).values_list('pk', flat=True))
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            processed = [name for name in executor.map(run_image_job, pks) if name]
+        self.stdout.write(f'{len(processed)}/{len(pks)} photos processed')
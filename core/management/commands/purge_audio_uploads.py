@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import AudioUpload
+from core.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    help = 'Delete the voice memo uploads left unfinished, with the chunks received so far.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=48,
+                            help='Delete the uploads without a new chunk for this many hours (default: 48).')
+
+    def handle(self, *args, **options):
+        stale = AudioUpload.objects.filter(
+            completed__isnull=True, modified__lt=timezone.now() - datetime.timedelta(hours=options['hours']))
+        count = 0
+        for upload in stale.iterator():
+            discard_upload(upload)
+            count += 1
+        self.stdout.write(f'{count} unfinished uploads deleted')
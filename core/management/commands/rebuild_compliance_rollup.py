@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.compliance import local_day, rebuild_rollups
+from core.models import ArchivedPatrolLog, PatrolLog
+
+
+class Command(BaseCommand):
+    help = 'Recompute the compliance rollups from the patrol logs, for all days or the given period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='end', help='Last day to rebuild, included (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        bounds = [model.objects.aggregate(first=Min('check_datetime'), last=Max('check_datetime'))
+                  for model in (PatrolLog, ArchivedPatrolLog)]
+        firsts = [bound['first'] for bound in bounds if bound['first'] is not None]
+        lasts = [bound['last'] for bound in bounds if bound['last'] is not None]
+        if not firsts:
+            self.stdout.write('No patrol logs.')
+            return
+        start = self.parse_day(options['start']) if options['start'] else local_day(min(firsts))
+        end = self.parse_day(options['end']) if options['end'] else local_day(max(lasts))
+        started = timezone.now()
+        rebuild_rollups(start, end + datetime.timedelta(days=1))
+        self.stdout.write(f'Compliance rollups rebuilt from {start} to {end} in '
+                          f'{(timezone.now() - started).total_seconds():.1f}s')
+
+    @staticmethod
+    def parse_day(value):
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
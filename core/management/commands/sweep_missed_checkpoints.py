@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.sweeper import sweep_missed_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Record the checkpoints whose due time passed without being checked since the previous run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, one sweep every --interval seconds.')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between two sweeps (default: 60).')
+
+    def handle(self, *args, **options):
+        while True:
+            sweep = sweep_missed_checkpoints()
+            self.stdout.write(f'{sweep.window_end:%Y-%m-%d %H:%M:%S}: {sweep.missed_count} missed checkpoints')
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.authentication import token_cache_stats
+from core.caching import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the API token cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after showing them.')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError('The default cache is local to each process: API tokens are not cached and '
+                               'the counters of the web processes cannot be read. Set MEMCACHED_LOCATION.')
+        stats = token_cache_stats.get()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups if lookups else 0
+        self.stdout.write(f'{stats["hits"]} hits, {stats["misses"]} misses ({ratio:.1%} hit ratio)')
+        if options['reset']:
+            token_cache_stats.reset()
@@ -0,0 +1,40 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.deadlines import DeadlineQueue, active_queues, record_missed
+
+
+class Command(BaseCommand):
+    help = 'Raise an alert as soon as a checkpoint passes its due time without being checked.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=6,
+                            help='Hours of upcoming deadlines kept in memory (default: 6).')
+        parser.add_argument('--refresh', type=float, default=5,
+                            help='Seconds between two looks for checkpoints changed elsewhere (default: 5).')
+        parser.add_argument('--lag', type=int, default=300,
+                            help='Seconds each look goes back to catch late commits, longer than the longest '
+                                 'checkpoint generation (default: 300).')
+
+    def handle(self, *args, **options):
+        queue = DeadlineQueue(horizon=datetime.timedelta(hours=options['horizon']),
+                              lag=datetime.timedelta(seconds=options['lag']))
+        active_queues.add(queue)
+        queue.load()
+        self.stdout.write(f'Watching {len(queue)} deadlines until {queue.loaded_until:%Y-%m-%d %H:%M}')
+
+        next_refresh = timezone.now()
+        while True:
+            now = timezone.now()
+            expired = queue.pop_expired(now)
+            if expired:
+                for missed in record_missed(expired, now):
+                    self.stdout.write(f'{now:%H:%M:%S} missed: patrol log {missed.patrol_log_id}')
+            if now >= next_refresh:
+                close_old_connections()
+                queue.refresh(now)
+                next_refresh = now + datetime.timedelta(seconds=options['refresh'])
+            queue.wait((next_refresh - timezone.now()).total_seconds())
@@ -0,0 +1,169 @@
+"""
+Delivery of the uploaded media (anomaly photos, voice memos).
+
+Files are only served to authenticated users allowed to view patrol logs, and to the
+users limited to some tenants only when a patrol log of their tenants refers to them.
+Behind a front proxy configured for it (MEDIA_ACCEL_REDIRECT), the view only checks the
+permissions and hands the transfer off with an X-Accel-Redirect or X-Sendfile header.
+Otherwise it serves the file itself, with conditional requests (ETag/Last-Modified)
+and single byte ranges, so repeat views get a 304 and audio players can seek.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from core.models import ArchivedPatrolLog, PatrolLog
+from core.tenancy import get_tenant_scope, scope_queryset
+
+# None (served by Django), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+MEDIA_ACCEL_REDIRECT = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+# Internal location of MEDIA_ROOT in the nginx configuration, for X-Accel-Redirect
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_CACHE_CONTROL = 'private, max-age=86400'
+BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) bytes (end included) of a single range header, None to send
+    the whole file (no header, several ranges or another unit) and raise ValueError when
+    the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    """Tell whether the range of the request applies to the current version of the file."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return etag in parse_etags(if_range)
+    modified_since = parse_http_date_safe(if_range)
+    return modified_since is not None and int(mtime) <= modified_since
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+    """Files are sent whatever the Accept header of the request, errors with the first renderer."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class MediaView(APIView):
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreAcceptNegotiation
+    swagger_schema = None
+
+    def get(self, request, path):
+        if not request.user.has_perm('core.view_patrollog'):
+            raise PermissionDenied()
+        try:
+            fullpath = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404()
+        if not os.path.isfile(fullpath) or not self.in_scope(request.user, path):
+            raise Http404()
+
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+        if MEDIA_ACCEL_REDIRECT:
+            return self.offloaded_response(path, fullpath, content_type)
+
+        stat = os.stat(fullpath)
+        etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(stat.st_mtime),
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': MEDIA_CACHE_CONTROL,
+        }
+        conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if conditional is not None:
+            return self.with_headers(conditional, headers)
+
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            headers['Content-Range'] = f'bytes */{stat.st_size}'
+            return self.with_headers(HttpResponse(status=416), headers)
+        if byte_range is None or not if_range_matches(request, etag, stat.st_mtime):
+            byte_range = (0, stat.st_size - 1)
+        else:
+            headers['Content-Range'] = f'bytes {byte_range[0]}-{byte_range[1]}/{stat.st_size}'
+
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(fullpath, start, end), content_type=content_type,
+                                         status=206 if 'Content-Range' in headers else 200)
+        headers['Content-Length'] = str(end - start + 1 if stat.st_size else 0)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return self.with_headers(response, headers)
+
+    @staticmethod
+    def in_scope(user, path):
+        if get_tenant_scope(user) is None:
+            return True
+        referring = Q(image_path=path) | Q(image_thumbnail=path) | Q(audio_path=default_storage.url(path))
+        return any(scope_queryset(model.objects.filter(referring), user).exists()
+                   for model in (PatrolLog, ArchivedPatrolLog))
+
+    @staticmethod
+    def offloaded_response(path, fullpath, content_type):
+        # The proxy sends the file, with its own Range and conditional request handling
+        response = HttpResponse(content_type=content_type)
+        if MEDIA_ACCEL_REDIRECT == 'x-sendfile':
+            response['X-Sendfile'] = fullpath
+        else:
+            response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + quote(path)
+        response['Cache-Control'] = MEDIA_CACHE_CONTROL
+        return response
+
+    @staticmethod
+    def with_headers(response, headers):
+        for name, value in headers.items():
+            response[name] = value
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:28
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.utils import timezone
+
+
+def init_materialized_until(apps, schema_editor):
+    # Zones confirmed before the rolling horizon existed already have their week generated.
+    Zone = apps.get_model('core', 'Zone')
+    PatrolLog = apps.get_model('core', 'PatrolLog')
+    last_checkpoints = PatrolLog.objects.values('tag__zone').annotate(last=Max('check_datetime'))
+    for row in last_checkpoints:
+        last_day = timezone.localdate(row['last']) if timezone.is_aware(row['last']) else row['last'].date()
+        Zone.objects.filter(pk=row['tag__zone']).update(materialized_until=last_day + datetime.timedelta(days=1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_auto_20230124_0505'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zone',
+            name='materialized_until',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name="Checkpoints générés jusqu'au"),
+        ),
+        migrations.RunPython(init_materialized_until, migrations.RunPython.noop),
+    ]
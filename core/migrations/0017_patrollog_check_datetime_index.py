@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_zone_materialized_until'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['check_datetime', 'id'], name='patrollog_check_datetime_idx'),
+        ),
+    ]
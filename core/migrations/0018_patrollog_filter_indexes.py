@@ -0,0 +1,25 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_patrollog_check_datetime_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['tag', 'check_datetime'], name='patrollog_tag_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['is_checked', 'check_datetime'], name='patrollog_checked_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['checked_by', 'check_datetime'], name='patrollog_employee_check_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_patrollog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tag',
+            name='code_nfc',
+            field=models.CharField(max_length=255, unique=True, verbose_name='code NFC'),
+        ),
+    ]
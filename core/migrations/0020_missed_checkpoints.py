@@ -0,0 +1,67 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:34
+
+from django.db import migrations, models
+from django.db.models import DateTimeField, ExpressionWrapper, F
+import django.db.models.deletion
+
+
+def init_due_datetime(apps, schema_editor):
+    PatrolLog = apps.get_model('core', 'PatrolLog')
+    PatrolLog.objects.update(
+        due_datetime=ExpressionWrapper(F('check_datetime') + F('check_tolerance'), output_field=DateTimeField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_tag_code_nfc_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckpointSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créé')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modifié')),
+                ('window_start', models.DateTimeField(verbose_name='Début de la fenêtre')),
+                ('window_end', models.DateTimeField(db_index=True, verbose_name='Fin de la fenêtre')),
+                ('missed_count', models.PositiveIntegerField(default=0, verbose_name='Passages manqués')),
+            ],
+            options={
+                'verbose_name': 'Détection des passages manqués',
+            },
+        ),
+        migrations.CreateModel(
+            name='MissedCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créé')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modifié')),
+                ('due_datetime', models.DateTimeField(verbose_name='Date / Heure limite')),
+                ('detected_datetime', models.DateTimeField(verbose_name='Détecté le')),
+            ],
+            options={
+                'verbose_name': 'Passage manqué',
+            },
+        ),
+        migrations.AddField(
+            model_name='patrollog',
+            name='due_datetime',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Date / Heure limite'),
+        ),
+        migrations.RunPython(init_due_datetime, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['is_checked', 'due_datetime'], name='patrollog_checked_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='missedcheckpoint',
+            name='patrol_log',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='missed', to='core.patrollog', verbose_name='Journal des tournées'),
+        ),
+        migrations.AddIndex(
+            model_name='missedcheckpoint',
+            index=models.Index(fields=['due_datetime', 'id'], name='missed_due_idx'),
+        ),
+    ]
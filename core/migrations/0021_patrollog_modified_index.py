@@ -0,0 +1,17 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_missed_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['modified'], name='patrollog_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_patrollog_modified_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplianceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créé')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modifié')),
+                ('day', models.DateField(verbose_name='Jour')),
+                ('planned', models.PositiveIntegerField(default=0, verbose_name='Passages prévus')),
+                ('checked', models.PositiveIntegerField(default=0, verbose_name='Passages effectués')),
+                ('late', models.PositiveIntegerField(default=0, verbose_name='Passages en retard')),
+                ('missed', models.PositiveIntegerField(default=0, verbose_name='Passages manqués')),
+                ('enterprise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.enterprise', verbose_name='Entreprise')),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site')),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.zone', verbose_name='Zone')),
+            ],
+            options={
+                'verbose_name': 'Taux de conformité',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='compliancerollup',
+            index=models.Index(fields=['site', 'day'], name='rollup_site_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compliancerollup',
+            index=models.Index(fields=['enterprise', 'day'], name='rollup_enterprise_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compliancerollup',
+            index=models.Index(fields=['day'], name='rollup_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='compliancerollup',
+            unique_together={('zone', 'day')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_compliance_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPatrolLog',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('audio_path', models.CharField(blank=True, max_length=255, null=True, verbose_name='Lien de la memo-vocale')),
+                ('image_path', models.ImageField(blank=True, null=True, upload_to='images/')),
+                ('description_anomaly', models.TextField(blank=True, null=True, verbose_name='Anomalie')),
+                ('is_checked', models.BooleanField(default=False, verbose_name='tag visité')),
+                ('check_datetime', models.DateTimeField(verbose_name='Date / Heure prévue ')),
+                ('check_tolerance', models.DurationField(verbose_name='Tolérance')),
+                ('checked_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Date / Heure de passage')),
+                ('due_datetime', models.DateTimeField(null=True, verbose_name='Date / Heure limite')),
+                ('missed_datetime', models.DateTimeField(null=True, verbose_name='Passage manqué détecté le')),
+                ('created', models.DateTimeField(verbose_name='Créé')),
+                ('modified', models.DateTimeField(verbose_name='Modifié')),
+                ('archived', models.DateTimeField(auto_now_add=True, verbose_name='Archivé')),
+                ('checked_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.employee', verbose_name='Controlé par')),
+                ('planning', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.planning', verbose_name='Planning')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tag', verbose_name='Tag')),
+            ],
+            options={
+                'verbose_name': 'Journal des tournées archivé',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedpatrollog',
+            index=models.Index(fields=['check_datetime', 'id'], name='archived_check_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpatrollog',
+            index=models.Index(fields=['tag', 'check_datetime'], name='archived_tag_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpatrollog',
+            index=models.Index(fields=['checked_by', 'check_datetime'], name='archived_employee_check_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_archived_patrollog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpatrollog',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='images/thumbnails/', verbose_name='Miniature'),
+        ),
+        migrations.AddField(
+            model_name='patrollog',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='images/thumbnails/', verbose_name='Miniature'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_image_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créé')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modifié')),
+                ('filename', models.CharField(max_length=255, verbose_name='Nom du fichier')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Taille (octets)')),
+                ('offset', models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Octets reçus')),
+                ('completed', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Terminé le')),
+                ('patrol_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='audio_uploads', to='core.patrollog', verbose_name='Journal des tournées')),
+            ],
+            options={
+                'verbose_name': 'Envoi de memo-vocale',
+            },
+        ),
+    ]
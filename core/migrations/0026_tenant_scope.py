@@ -0,0 +1,87 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def init_sites(apps, schema_editor):
+    Tag = apps.get_model('core', 'Tag')
+    PatrolLog = apps.get_model('core', 'PatrolLog')
+    tag_site = Subquery(Tag.objects.filter(pk=OuterRef('tag_id')).values('zone__site_id')[:1])
+    for model_name in ('PatrolLog', 'ArchivedPatrolLog'):
+        apps.get_model('core', model_name).objects.update(site_id=tag_site)
+    patrol_log_site = Subquery(PatrolLog.objects.filter(pk=OuterRef('patrol_log_id')).values('site_id')[:1])
+    apps.get_model('core', 'MissedCheckpoint').objects.update(site_id=patrol_log_site)
+
+
+def grant_existing_users(apps, schema_editor):
+    # The accounts created before the tenants keep seeing every enterprise until restricted
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Enterprise = apps.get_model('core', 'Enterprise')
+    TenantMembership = apps.get_model('core', 'TenantMembership')
+    enterprise_ids = list(Enterprise.objects.values_list('pk', flat=True))
+    TenantMembership.objects.bulk_create([
+        TenantMembership(user_id=user_id, enterprise_id=enterprise_id)
+        for user_id in User.objects.filter(is_superuser=False).values_list('pk', flat=True)
+        for enterprise_id in enterprise_ids
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0025_audio_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Créé')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modifié')),
+            ],
+            options={
+                'verbose_name': 'Accès client',
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedpatrollog',
+            name='site',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AddField(
+            model_name='missedcheckpoint',
+            name='site',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AddField(
+            model_name='patrollog',
+            name='site',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.RunPython(init_sites, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='tenantmembership',
+            name='enterprise',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.enterprise', verbose_name='Entreprise'),
+        ),
+        migrations.AddField(
+            model_name='tenantmembership',
+            name='site',
+            field=models.ForeignKey(blank=True, help_text="Vide : tous les sites de l'entreprise", null=True, on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AddField(
+            model_name='tenantmembership',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tenant_memberships', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='tenantmembership',
+            unique_together={('user', 'enterprise', 'site')},
+        ),
+        migrations.RunPython(grant_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Separate from 0026: PostgreSQL cannot alter the tables its data migration updated in the same transaction
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_tenant_scope'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpatrollog',
+            name='site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AlterField(
+            model_name='missedcheckpoint',
+            name='site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AlterField(
+            model_name='patrollog',
+            name='site',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='core.site', verbose_name='Site'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpatrollog',
+            index=models.Index(fields=['site', 'check_datetime', 'id'], name='archived_site_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='missedcheckpoint',
+            index=models.Index(fields=['site', 'due_datetime', 'id'], name='missed_site_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['site', 'check_datetime', 'id'], name='patrollog_site_check_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patrollog',
+            index=models.Index(fields=['site', 'is_checked', 'due_datetime'], name='patrollog_site_due_idx'),
+        ),
+    ]
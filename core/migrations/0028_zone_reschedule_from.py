@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_tenant_scope_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zone',
+            name='reschedule_from',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Checkpoints à replanifier à partir du'),
+        ),
+    ]
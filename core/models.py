@@ -1,8 +1,6 @@
-import datetime
-
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.utils import timezone
+from django.db import models, transaction
 import calendar
 
 # Calendar settings
@@ -53,6 +51,11 @@ class Zone(TimestampModel):
     designation = models.CharField(max_length=255, verbose_name='Nom de la zone')
     site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site')
     plan_state = models.IntegerField(choices=PLAN_STATES, default=PLAN_STATES[0][0], editable=False)
+    materialized_until = models.DateField(verbose_name='Checkpoints générés jusqu\'au', blank=True, null=True,
+                                          editable=False)
+    # First holiday changed since the checkpoints were generated, see core.scheduling.reconcile_holidays
+    reschedule_from = models.DateField(verbose_name='Checkpoints à replanifier à partir du', blank=True, null=True,
+                                       editable=False)
 
     def __str__(self):
         return self.designation + f" ({self.site.designation} - {self.site.enterprise.designation})"
@@ -65,42 +68,16 @@ class Zone(TimestampModel):
         self.plan_state = self.PLAN_STATES[0][0]
         self.save()
 
-    def create_planned_checkpoints(self):
-        current_datetime = timezone.now()
-        today = current_datetime.date()
-        today_weekday_index = calendar.weekday(today.year, today.month, today.day)
-
-        # Update check plan
-        future_plans = PatrolLog.objects.filter(
-            check_datetime__gte=current_datetime,
-            tag__zone=self
-        )
-        future_plans.delete()
-
-        related_tags = Tag.objects.filter(zone=self)  # Tags assigned to the current Zone
-        zone_planning = Planning.objects.filter(zone=self)
-
-        for plan in zone_planning:
-            if plan.selected_day_index != HOLIDAY_DAY_INDEX:  # holidays index
-                for tag in related_tags:
-                    if today_weekday_index <= plan.selected_day_index:
-                        check_date = today + datetime.timedelta(plan.selected_day_index - today_weekday_index)
-                    else:
-                        check_date = today + datetime.timedelta(plan.selected_day_index)
-                    check_time = plan.patrol_check_time
-                    check_datetime = datetime.datetime.combine(check_date, check_time)
-                    PatrolLog.objects.create(
-                        tag=tag,
-                        check_tolerance=plan.tolerated_time,
-                        check_datetime=check_datetime,
-                        planning=plan
-                    )
-                    # todo if holidays ?
+    def create_planned_checkpoints(self, reconcile=True):
+        """Update the future checkpoints, see `core.scheduling.generate_checkpoints`."""
+        from core.scheduling import generate_checkpoints
+        return generate_checkpoints(self, reconcile=reconcile)
 
     def do_action(self, action, user):
         if action == 'confirm':
-            self.create_planned_checkpoints()
-            self.validate_plan()
+            with transaction.atomic():
+                self.create_planned_checkpoints()
+                self.validate_plan()
         elif action == 'reopen':
             self.invalidate_plan()
 
@@ -120,7 +97,7 @@ class Employee(TimestampModel):
 
 class Tag(TimestampModel):
     zone = models.ForeignKey(Zone, on_delete=models.CASCADE, verbose_name='Zone')
-    code_nfc = models.CharField(max_length=255, verbose_name='code NFC')
+    code_nfc = models.CharField(max_length=255, verbose_name='code NFC', unique=True)
     designation = models.CharField(max_length=255, verbose_name='Nom du TAG')
     order = models.PositiveIntegerField(verbose_name='Ordre', blank=True, null=True)
     observation = models.CharField(max_length=255, verbose_name='Observation')
@@ -159,8 +136,12 @@ class Planning(TimestampModel):
 
 class PatrolLog(TimestampModel):
     tag = models.ForeignKey(Tag, on_delete=models.CASCADE, verbose_name='Tag')
+    # Site of the tag, the tenant key leading the indexes of the scoped queries
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site', editable=False)
     audio_path = models.CharField(max_length=255, verbose_name='Lien de la memo-vocale', blank=True, null=True)
     image_path = models.ImageField(null=True, blank=True, upload_to="images/")
+    image_thumbnail = models.ImageField(verbose_name='Miniature', null=True, blank=True, editable=False,
+                                        upload_to="images/thumbnails/")
     description_anomaly = models.TextField(verbose_name='Anomalie', blank=True, null=True)
     is_checked = models.BooleanField(verbose_name='tag visité', default=False)
     check_datetime = models.DateTimeField('Date / Heure prévue ')
@@ -171,9 +152,150 @@ class PatrolLog(TimestampModel):
                                    verbose_name=('Controlé par'),
                                    null=True, blank=True, editable=False)
     planning = models.ForeignKey(Planning, on_delete=models.SET_NULL,null=True, verbose_name='Planning')
+    due_datetime = models.DateTimeField(verbose_name='Date / Heure limite', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Journal des tournées'
+        indexes = [
+            models.Index(fields=['check_datetime', 'id'], name='patrollog_check_datetime_idx'),
+            models.Index(fields=['site', 'check_datetime', 'id'], name='patrollog_site_check_idx'),
+            models.Index(fields=['site', 'is_checked', 'due_datetime'], name='patrollog_site_due_idx'),
+            models.Index(fields=['tag', 'check_datetime'], name='patrollog_tag_check_idx'),
+            models.Index(fields=['is_checked', 'check_datetime'], name='patrollog_checked_check_idx'),
+            models.Index(fields=['checked_by', 'check_datetime'], name='patrollog_employee_check_idx'),
+            models.Index(fields=['is_checked', 'due_datetime'], name='patrollog_checked_due_idx'),
+            models.Index(fields=['modified'], name='patrollog_modified_idx'),
+        ]
+
+    def __str__(self):
+        return self.tag.designation
+
+    def save(self, *args, **kwargs):
+        # Kept in sync here and by the bulk writers of core.scheduling
+        self.due_datetime = self.check_datetime + self.check_tolerance
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'check_datetime', 'check_tolerance'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'due_datetime'}
+        if update_fields is None or 'tag' in update_fields:
+            self.site_id = Zone.objects.filter(tag__id=self.tag_id).values_list('site_id', flat=True).first()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'site'}
+        super().save(*args, **kwargs)
+
+
+class MissedCheckpoint(TimestampModel):
+    patrol_log = models.OneToOneField(PatrolLog, on_delete=models.CASCADE, related_name='missed',
+                                      verbose_name='Journal des tournées')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site')
+    due_datetime = models.DateTimeField(verbose_name='Date / Heure limite')
+    detected_datetime = models.DateTimeField(verbose_name='Détecté le')
+
+    class Meta:
+        verbose_name = 'Passage manqué'
+        indexes = [
+            models.Index(fields=['due_datetime', 'id'], name='missed_due_idx'),
+            models.Index(fields=['site', 'due_datetime', 'id'], name='missed_site_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patrol_log_id} ({self.due_datetime})"
+
+
+class CheckpointSweep(TimestampModel):
+    window_start = models.DateTimeField(verbose_name='Début de la fenêtre')
+    window_end = models.DateTimeField(verbose_name='Fin de la fenêtre', db_index=True)
+    missed_count = models.PositiveIntegerField(verbose_name='Passages manqués', default=0)
+
+    class Meta:
+        verbose_name = 'Détection des passages manqués'
+
+
+class ComplianceRollup(TimestampModel):
+    day = models.DateField(verbose_name='Jour')
+    zone = models.ForeignKey(Zone, on_delete=models.CASCADE, verbose_name='Zone')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site')
+    enterprise = models.ForeignKey(Enterprise, on_delete=models.CASCADE, verbose_name='Entreprise')
+    planned = models.PositiveIntegerField(verbose_name='Passages prévus', default=0)
+    checked = models.PositiveIntegerField(verbose_name='Passages effectués', default=0)
+    late = models.PositiveIntegerField(verbose_name='Passages en retard', default=0)
+    missed = models.PositiveIntegerField(verbose_name='Passages manqués', default=0)
+
+    class Meta:
+        verbose_name = 'Taux de conformité'
+        unique_together = [('zone', 'day')]
+        indexes = [
+            models.Index(fields=['site', 'day'], name='rollup_site_day_idx'),
+            models.Index(fields=['enterprise', 'day'], name='rollup_enterprise_day_idx'),
+            models.Index(fields=['day'], name='rollup_day_idx'),
+        ]
+
+
+class ArchivedPatrolLog(models.Model):
+    # Same columns as PatrolLog, so the serializers, filters and exports read both tables alike
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, verbose_name='Tag')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site')
+    audio_path = models.CharField(max_length=255, verbose_name='Lien de la memo-vocale', blank=True, null=True)
+    image_path = models.ImageField(null=True, blank=True, upload_to="images/")
+    image_thumbnail = models.ImageField(verbose_name='Miniature', null=True, blank=True,
+                                        upload_to="images/thumbnails/")
+    description_anomaly = models.TextField(verbose_name='Anomalie', blank=True, null=True)
+    is_checked = models.BooleanField(verbose_name='tag visité', default=False)
+    check_datetime = models.DateTimeField('Date / Heure prévue ')
+    check_tolerance = models.DurationField('Tolérance')
+    checked_datetime = models.DateTimeField(verbose_name='Date / Heure de passage', blank=True, null=True)
+    checked_by = models.ForeignKey(Employee, on_delete=models.PROTECT, verbose_name=('Controlé par'),
+                                   null=True, blank=True)
+    planning = models.ForeignKey(Planning, on_delete=models.SET_NULL, null=True, verbose_name='Planning')
+    due_datetime = models.DateTimeField(verbose_name='Date / Heure limite', null=True)
+    missed_datetime = models.DateTimeField(verbose_name='Passage manqué détecté le', null=True)
+    created = models.DateTimeField(verbose_name='Créé')
+    modified = models.DateTimeField(verbose_name='Modifié')
+    archived = models.DateTimeField(auto_now_add=True, verbose_name='Archivé')
+
+    class Meta:
+        verbose_name = 'Journal des tournées archivé'
+        indexes = [
+            models.Index(fields=['check_datetime', 'id'], name='archived_check_datetime_idx'),
+            models.Index(fields=['site', 'check_datetime', 'id'], name='archived_site_check_idx'),
+            models.Index(fields=['tag', 'check_datetime'], name='archived_tag_check_idx'),
+            models.Index(fields=['checked_by', 'check_datetime'], name='archived_employee_check_idx'),
+        ]
 
     def __str__(self):
         return self.tag.designation
+
+
+class AudioUpload(TimestampModel):
+    patrol_log = models.ForeignKey(PatrolLog, on_delete=models.CASCADE, related_name='audio_uploads',
+                                   verbose_name='Journal des tournées')
+    filename = models.CharField(max_length=255, verbose_name='Nom du fichier')
+    size = models.PositiveBigIntegerField(verbose_name='Taille (octets)')
+    offset = models.PositiveBigIntegerField(verbose_name='Octets reçus', default=0, editable=False)
+    completed = models.DateTimeField(verbose_name='Terminé le', blank=True, null=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Envoi de memo-vocale'
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class TenantMembership(TimestampModel):
+    """Gives a user access to the data of a whole enterprise, or of one of its sites only."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='tenant_memberships',
+                             verbose_name='Utilisateur')
+    enterprise = models.ForeignKey(Enterprise, on_delete=models.CASCADE, verbose_name='Entreprise')
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, verbose_name='Site', blank=True, null=True,
+                             help_text='Vide : tous les sites de l\'entreprise')
+
+    class Meta:
+        verbose_name = 'Accès client'
+        unique_together = [('user', 'enterprise', 'site')]
+
+    def __str__(self):
+        return f"{self.user} - {self.site or self.enterprise}"
+
+    def clean(self):
+        if self.site_id is not None and self.site.enterprise_id != self.enterprise_id:
+            raise ValidationError({'site': 'Ce site n\'appartient pas à l\'entreprise.'})
@@ -0,0 +1,133 @@
+import base64
+import heapq
+import itertools
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a (datetime, id) key.
+
+    Each page is fetched with a range condition on the key instead of an offset, so
+    the cost of a page does not depend on how deep the client has scrolled. The cursor
+    is an opaque token holding the key of the first/last row of the current page.
+    """
+    ordering = ('check_datetime', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 100)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """Paginate the rows of several querysets as one sequence, e.g. the hot and archived patrol logs."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor['r'])
+
+        pages = [self.get_page_queryset(queryset) for queryset in querysets]
+        rows = pages[0] if len(pages) == 1 else heapq.merge(*pages, key=attrgetter(*self.ordering),
+                                                            reverse=self.reverse)
+        results = list(itertools.islice(rows, self.page_size + 1))
+        has_more = len(results) > self.page_size
+        del results[self.page_size:]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = has_more if self.reverse else self.cursor is not None
+        self.first = results[0] if results else None
+        self.last = results[-1] if results else None
+        return results
+
+    def get_page_queryset(self, queryset):
+        """Return the queryset of the requested page, with one extra row to detect the next one."""
+        date_field, id_field = self.ordering
+        if self.reverse:
+            queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        else:
+            queryset = queryset.order_by(date_field, id_field)
+
+        if self.cursor is not None:
+            lookup = 'lt' if self.reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{lookup}': self.cursor['d']}) |
+                Q(**{date_field: self.cursor['d'], f'{id_field}__{lookup}': self.cursor['i']})
+            )
+        return queryset[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.last is None:
+            # Empty page reached backwards: restart from the beginning.
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        date_field, id_field = self.ordering
+        payload = {'d': getattr(obj, date_field).isoformat(), 'i': getattr(obj, id_field), 'r': reverse}
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            cursor = {'d': parse_datetime(payload['d']), 'i': int(payload['i']), 'r': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['d'] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+class DueKeysetPagination(KeysetPagination):
+    ordering = ('due_datetime', 'id')
@@ -0,0 +1,62 @@
+"""
+Cached permission backend.
+
+ModelBackend loads the permissions of a user with two queries (own and group
+permissions) the first time they are checked on a user instance, so once per request.
+CachedModelBackend keeps these sets in the cache, so the permission checks of the API
+and of the views cost no query once warm.
+
+Entries are keyed by user and by the versions of Group and Permission (see
+core.caching): the signals of core.signals bump these versions when the permissions of a
+group or the permissions themselves change, which invalidates every user at once, and
+delete the entry of a user whose groups, permissions or flags change. Other processes
+only see these invalidations through a shared cache: with a cache local to each process,
+the permissions are loaded once per request as ModelBackend does. Object permissions are
+not affected: ModelBackend grants none and answers without any query.
+
+ChangeModelPermissions is the API permission of the actions updating existing rows
+through a POST, such as the NFC scans.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from rest_framework.permissions import DjangoModelPermissions
+
+from core.caching import cache_is_shared, get_model_versions
+
+PERMISSION_CACHE_TTL = getattr(settings, 'PERMISSION_CACHE_TTL', 60 * 60)
+
+
+def permissions_cache_key(user_id):
+    versions = '.'.join(str(version) for version in get_model_versions([Group, Permission]))
+    return f'core:permissions:{versions}:{user_id}'
+
+
+def invalidate_user_permissions(user_ids):
+    cache.delete_many([permissions_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+
+    def _get_permissions(self, user_obj, obj, from_name):
+        if user_obj.is_active and not user_obj.is_anonymous and obj is None and cache_is_shared():
+            self.load_permissions(user_obj)
+        return super()._get_permissions(user_obj, obj, from_name)
+
+    def load_permissions(self, user_obj):
+        """Set the user and group permission sets ModelBackend memoizes on the user instance from the cache."""
+        if hasattr(user_obj, '_user_perm_cache') and hasattr(user_obj, '_group_perm_cache'):
+            return
+        key = permissions_cache_key(user_obj.pk)
+        cached = cache.get(key)
+        if cached is None:
+            cached = (super()._get_permissions(user_obj, None, 'user'),
+                      super()._get_permissions(user_obj, None, 'group'))
+            cache.set(key, cached, PERMISSION_CACHE_TTL)
+        user_obj._user_perm_cache, user_obj._group_perm_cache = cached
+
+
+class ChangeModelPermissions(DjangoModelPermissions):
+    """Require the change permission of the model for the POST requests as well."""
+    perms_map = {**DjangoModelPermissions.perms_map, 'POST': ['%(app_label)s.change_%(model_name)s']}
@@ -0,0 +1,67 @@
+"""
+Guard rounds: the checkpoints a site has to patrol now and next.
+
+The round of a site is computed at most once per time bucket and kept in the cache
+together with its ETag, so polling phones mostly get a 304 without touching the database.
+"""
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.models import PatrolLog
+from core.serializers import RoundCheckpointSerializer
+
+ROUND_BUCKET_SECONDS = getattr(settings, 'ROUND_BUCKET_SECONDS', 30)
+ROUND_LOOKAHEAD = datetime.timedelta(minutes=getattr(settings, 'ROUND_LOOKAHEAD_MINUTES', 120))
+
+
+def round_version_key(site_id):
+    return f'core:round-version:{site_id}'
+
+
+def bump_round_version(site_id):
+    """Make the cached round of the site stale before the end of its time bucket."""
+    try:
+        cache.incr(round_version_key(site_id))
+    except ValueError:
+        cache.set(round_version_key(site_id), 1, None)
+
+
+def build_round(site_id, now):
+    """Return the unchecked checkpoints of the site that are open at `now` and due in the lookahead window."""
+    checkpoints = PatrolLog.objects.filter(
+        site_id=site_id,
+        is_checked=False,
+        due_datetime__gte=now,
+        check_datetime__lte=now + ROUND_LOOKAHEAD,
+    ).select_related('tag__zone').order_by('check_datetime', 'tag__order', 'id')
+
+    current, upcoming = [], []
+    for checkpoint in checkpoints:
+        (current if checkpoint.check_datetime <= now else upcoming).append(checkpoint)
+    return {
+        'site': site_id,
+        'current': [dict(row) for row in RoundCheckpointSerializer(current, many=True).data],
+        'next': [dict(row) for row in RoundCheckpointSerializer(upcoming, many=True).data],
+    }
+
+
+def get_round(site_id, now=None):
+    """Return the (payload, etag) of the site round, from the cache when available."""
+    now = now or timezone.now()
+    version = cache.get(round_version_key(site_id), 0)
+    bucket = int(now.timestamp()) // ROUND_BUCKET_SECONDS
+    key = f'core:round:{site_id}:{version}:{bucket}'
+
+    cached = cache.get(key)
+    if cached is None:
+        payload = build_round(site_id, now)
+        content = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True)
+        cached = (payload, '"%s"' % hashlib.md5(content.encode()).hexdigest())
+        cache.set(key, cached, ROUND_BUCKET_SECONDS)
+    return cached
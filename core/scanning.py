@@ -0,0 +1,179 @@
+"""
+NFC scan ingestion.
+
+A scan (code NFC, employee, time) is matched to the unchecked PatrolLog of the tag whose
+window (check_datetime +/- check_tolerance) contains the scan time.
+"""
+import datetime
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F
+from django.utils import timezone
+
+from core.compliance import local_day, refresh_rollups
+from core.models import MissedCheckpoint, PatrolLog, Tag
+from core.rounds import bump_round_version
+
+TAG_CACHE_TTL = getattr(settings, 'TAG_CACHE_TTL', 300)
+SCAN_MAX_TOLERANCE = datetime.timedelta(minutes=getattr(settings, 'SCAN_MAX_TOLERANCE_MINUTES', 24 * 60))
+
+TagRef = namedtuple('TagRef', ['tag_id', 'zone_id', 'site_id'])
+ScanEvent = namedtuple('ScanEvent', ['code_nfc', 'employee', 'scanned_at'])
+# `already_checked`: the scan was applied before, by a previous request sending it again
+ScanResult = namedtuple('ScanResult', ['patrol_log', 'error', 'already_checked'], defaults=[False])
+
+
+class ScanError(Exception):
+    UNKNOWN_TAG = 'unknown_tag'
+    WRONG_SITE = 'wrong_site'
+    NO_OPEN_CHECKPOINT = 'no_open_checkpoint'
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class TagCodeCache:
+    """In-process code NFC -> TagRef cache, entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, code_nfc):
+        return self.get_many([code_nfc])[code_nfc]
+
+    def get_many(self, codes):
+        """Return a {code: TagRef or None} mapping, loading every missing code with one query."""
+        now = time.monotonic()
+        found = {}
+        missing = set()
+        for code in codes:
+            entry = self._entries.get(code)
+            if entry is None or entry[1] < now:
+                missing.add(code)
+            else:
+                found[code] = entry[0]
+        if missing:
+            refs = {code: TagRef(pk, zone_id, site_id) for code, pk, zone_id, site_id in
+                    Tag.objects.filter(code_nfc__in=missing).values_list('code_nfc', 'pk', 'zone_id', 'zone__site_id')}
+            with self._lock:
+                for code in missing:
+                    found[code] = refs.get(code)
+                    self._entries[code] = (found[code], now + self.ttl)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tag_cache = TagCodeCache(TAG_CACHE_TTL)
+
+
+def with_window(queryset):
+    # The window ends at PatrolLog.due_datetime
+    return queryset.annotate(
+        window_start=ExpressionWrapper(F('check_datetime') - F('check_tolerance'), output_field=DateTimeField()),
+    )
+
+
+def record_scan(code_nfc, employee, scanned_at=None):
+    """Mark the checkpoint matching the scan as checked by `employee` and return it."""
+    result, = record_scans([ScanEvent(code_nfc, employee, scanned_at or timezone.now())])
+    if result.error is not None:
+        raise result.error
+    return result.patrol_log
+
+
+def record_scans(events):
+    """
+    Match a batch of ScanEvent to their checkpoints and mark them as checked.
+
+    Tags are resolved from the cache, the candidate checkpoints of the whole batch are
+    locked with one query and the matched ones saved with one bulk update, all in a
+    single transaction. Events are applied in scan time order; return one ScanResult
+    per event, in the order of `events`. An event already applied (same tag, employee
+    and scan time) returns its checkpoint again, so a batch can be safely sent twice.
+    """
+    results = [None] * len(events)
+    tags = tag_cache.get_many({event.code_nfc for event in events})
+    pending = []
+    for index, event in enumerate(events):
+        tag = tags[event.code_nfc]
+        if tag is None:
+            results[index] = ScanResult(None, ScanError(ScanError.UNKNOWN_TAG, 'Unknown NFC code.'))
+        elif tag.site_id != event.employee.site_id:
+            results[index] = ScanResult(None, ScanError(
+                ScanError.WRONG_SITE, 'This tag does not belong to the site of the employee.'))
+        else:
+            pending.append((event.scanned_at, index, tag))
+    if not pending:
+        return results
+
+    pending.sort(key=lambda item: item[:2])
+    now = timezone.now()
+    with transaction.atomic():
+        # The check_datetime range uses the (tag, check_datetime) index, the windows are
+        # compared in SQL too so only the rows open during the batch are locked
+        first, last = pending[0][0], pending[-1][0]
+        candidates = with_window(PatrolLog.objects.filter(
+            tag_id__in={tag.tag_id for _, _, tag in pending},
+            is_checked=False,
+            check_datetime__gte=first - SCAN_MAX_TOLERANCE,
+            check_datetime__lte=last + SCAN_MAX_TOLERANCE,
+            due_datetime__gte=first,
+        )).filter(window_start__lte=last).select_for_update().order_by('check_datetime', 'id')
+        if len(pending) == 1:
+            candidates = candidates[:1]
+        candidates_by_tag = defaultdict(list)
+        for checkpoint in candidates:
+            candidates_by_tag[checkpoint.tag_id].append(checkpoint)
+
+        checked = []
+        for scanned_at, index, tag in pending:
+            checkpoint = next((checkpoint for checkpoint in candidates_by_tag[tag.tag_id]
+                               if not checkpoint.is_checked
+                               and checkpoint.window_start <= scanned_at <= checkpoint.due_datetime), None)
+            if checkpoint is None:
+                results[index] = ScanResult(None, ScanError(
+                    ScanError.NO_OPEN_CHECKPOINT, 'No open checkpoint for this tag at this time.'))
+                continue
+            checkpoint.is_checked = True
+            checkpoint.checked_datetime = scanned_at
+            checkpoint.checked_by = events[index].employee
+            checkpoint.modified = now
+            checked.append(checkpoint)
+            results[index] = ScanResult(checkpoint, None)
+        PatrolLog.objects.bulk_update(checked, ['is_checked', 'checked_datetime', 'checked_by', 'modified'])
+        # A late scan (a batch synced after the sweep) is no longer a missed checkpoint
+        MissedCheckpoint.objects.filter(patrol_log__in=checked).delete()
+        refresh_rollups({(tag.zone_id, local_day(results[index].patrol_log.check_datetime))
+                         for _, index, tag in pending if results[index].patrol_log is not None}, now)
+        find_replayed_scans(events, [(index, tag) for _, index, tag in pending if results[index].error], results)
+
+    for site_id in {tag.site_id for _, _, tag in pending}:
+        bump_round_version(site_id)
+    return results
+
+
+def find_replayed_scans(events, unmatched, results):
+    """Set the result of the (index, tag) `unmatched` events whose scan already checked a checkpoint."""
+    if not unmatched:
+        return
+    replayed = {(checkpoint.tag_id, checkpoint.checked_by_id, checkpoint.checked_datetime): checkpoint
+                for checkpoint in PatrolLog.objects.filter(
+                    tag_id__in={tag.tag_id for _, tag in unmatched},
+                    is_checked=True,
+                    checked_datetime__in={events[index].scanned_at for index, _ in unmatched})}
+    for index, tag in unmatched:
+        event = events[index]
+        checkpoint = replayed.get((tag.tag_id, event.employee.pk, event.scanned_at))
+        if checkpoint is not None:
+            results[index] = ScanResult(checkpoint, None, already_checked=True)
@@ -0,0 +1,241 @@
+"""
+Checkpoint generation engine.
+
+Expands the weekly plannings of a zone into PatrolLog rows and writes them in bulk.
+"""
+import datetime
+import logging
+import time
+from collections import defaultdict, namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from core.caching import cache_is_shared
+from core.compliance import local_day, refresh_rollups, refresh_zone_rollups
+from core.models import HOLIDAY_DAY_INDEX, Holiday, PatrolLog, Planning, Tag, Zone
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+ONE_DAY = datetime.timedelta(days=1)
+ONE_WEEK = datetime.timedelta(days=7)
+HOLIDAY_INDEX_CACHE_KEY = 'core:holiday-index'
+
+# Sent with `zone_ids` once the checkpoints of these zones were written
+checkpoints_planned = Signal()
+
+CheckpointGenerationResult = namedtuple('CheckpointGenerationResult', ['created', 'updated', 'deleted', 'duration'])
+
+
+def get_holiday_index():
+    """
+    Return the holiday dates grouped by year, as a {year: frozenset(dates)} mapping.
+
+    The index is built with a single query. With a cache shared by every process it is
+    kept until a Holiday is saved or deleted (see `core.signals`); a process local cache
+    would keep serving the old dates after another process changed them.
+    """
+    index = cache.get(HOLIDAY_INDEX_CACHE_KEY) if cache_is_shared() else None
+    if index is None:
+        dates = defaultdict(set)
+        for date in Holiday.objects.values_list('date', flat=True):
+            dates[date.year].add(date)
+        index = {year: frozenset(days) for year, days in dates.items()}
+        if cache_is_shared():
+            cache.set(HOLIDAY_INDEX_CACHE_KEY, index, None)
+    return index
+
+
+def expand_schedule(plannings, tags, site_id, start_date, end_date, not_before=None, holidays=None):
+    """
+    Build the unsaved PatrolLog of every (planning x tag) pair planned between
+    `start_date` (included) and `end_date` (excluded), `tags` being on the site `site_id`.
+
+    On the dates found in the `holidays` index the holiday plannings replace the weekday
+    ones; zones without holiday plannings keep their weekday schedule.
+    """
+    holidays = holidays or {}
+    plannings_by_day = defaultdict(list)
+    for plan in plannings:
+        plannings_by_day[plan.selected_day_index].append(plan)
+
+    rows = []
+    day = start_date
+    while day < end_date:
+        day_index = day.weekday()
+        if day in holidays.get(day.year, ()) and plannings_by_day.get(HOLIDAY_DAY_INDEX):
+            day_index = HOLIDAY_DAY_INDEX
+        for plan in plannings_by_day.get(day_index, ()):
+            check_datetime = timezone.make_aware(datetime.datetime.combine(day, plan.patrol_check_time))
+            if not_before is not None and check_datetime < not_before:
+                continue
+            for tag in tags:
+                rows.append(PatrolLog(
+                    tag_id=tag.pk,
+                    site_id=site_id,
+                    planning_id=plan.pk,
+                    check_datetime=check_datetime,
+                    check_tolerance=plan.tolerated_time,
+                    due_datetime=check_datetime + plan.tolerated_time,
+                ))
+        day += ONE_DAY
+    return rows
+
+
+def generate_checkpoints(zone, now=None, reconcile=True):
+    """
+    Bring the future checkpoints of `zone` in line with its plannings, from today up to
+    the end of its materialized horizon (at least one week).
+
+    With `reconcile` only the difference between the planned and the existing rows is
+    written (see `reconcile_checkpoints`); otherwise every future row is deleted and
+    inserted again. Everything happens in a single transaction with bulk queries.
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+
+    tags = list(Tag.objects.filter(zone=zone).only('pk'))
+    plannings = list(Planning.objects.filter(zone=zone))
+
+    with transaction.atomic():
+        materialized_until = Zone.objects.select_for_update().values_list(
+            'materialized_until', flat=True).get(pk=zone.pk)
+        until = max(materialized_until or today, today + ONE_WEEK)
+        rows = expand_schedule(plannings, tags, zone.site_id, today, until, not_before=now,
+                               holidays=get_holiday_index())
+        future_checkpoints = PatrolLog.objects.filter(tag__zone=zone, check_datetime__gte=now)
+        if reconcile:
+            created, updated, deleted = reconcile_checkpoints(future_checkpoints, rows, now)
+        else:
+            deleted, _ = future_checkpoints.delete()
+            created, updated = len(PatrolLog.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)), 0
+        Zone.objects.filter(pk=zone.pk).update(materialized_until=until, reschedule_from=None)
+    zone.materialized_until, zone.reschedule_from = until, None
+    refresh_zone_rollups([zone.pk], today, until, now)
+    checkpoints_planned.send(sender=Zone, zone_ids=[zone.pk])
+
+    result = CheckpointGenerationResult(created=created, updated=updated, deleted=deleted,
+                                        duration=time.monotonic() - started)
+    logger.info('Zone %s: %s checkpoints created, %s updated, %s removed in %.3fs',
+                zone.pk, result.created, result.updated, result.deleted, result.duration)
+    return result
+
+
+def reconcile_checkpoints(existing, rows, now):
+    """
+    Apply to the `existing` PatrolLog queryset the delta needed to match the planned `rows`.
+
+    Rows are matched on (tag, check_datetime): matches keep their id and only get their
+    planning and tolerance refreshed when they changed, unmatched planned rows are
+    inserted and unmatched existing rows are deleted unless they were already checked.
+    Return the (created, updated, deleted) counts.
+    """
+    planned = {(row.tag_id, row.check_datetime): row for row in rows}
+    to_update = []
+    to_delete = []
+    for checkpoint in existing.only('pk', 'tag', 'planning', 'check_datetime', 'check_tolerance', 'is_checked'):
+        row = planned.pop((checkpoint.tag_id, checkpoint.check_datetime), None)
+        if row is None:
+            if not checkpoint.is_checked:
+                to_delete.append(checkpoint.pk)
+        elif (checkpoint.planning_id, checkpoint.check_tolerance) != (row.planning_id, row.check_tolerance):
+            checkpoint.planning_id = row.planning_id
+            checkpoint.check_tolerance = row.check_tolerance
+            checkpoint.due_datetime = row.due_datetime
+            checkpoint.modified = now
+            to_update.append(checkpoint)
+
+    for offset in range(0, len(to_delete), BULK_BATCH_SIZE):
+        PatrolLog.objects.filter(pk__in=to_delete[offset:offset + BULK_BATCH_SIZE]).delete()
+    PatrolLog.objects.bulk_update(to_update, ['planning', 'check_tolerance', 'due_datetime', 'modified'],
+                                  batch_size=BULK_BATCH_SIZE)
+    PatrolLog.objects.bulk_create(planned.values(), batch_size=BULK_BATCH_SIZE)
+    return len(planned), len(to_update), len(to_delete)
+
+
+def mark_holiday_changes(dates, now=None):
+    """
+    Flag the checkpoints already generated on the holiday `dates` that were just added,
+    moved or removed: the validated zones with holiday plannings materialized past one of
+    these dates are left to `reconcile_holidays`, which switches these days between their
+    holiday and weekday schedules. Return the number of zones flagged.
+    """
+    now = now or timezone.now()
+    dates = [date for date in dates if date >= timezone.localdate(now)]
+    if not dates:
+        return 0
+    first = min(dates)
+    zones = Zone.objects.filter(
+        plan_state=Zone.PLAN_STATES[1][0],
+        materialized_until__gt=first,
+        planning__selected_day_index=HOLIDAY_DAY_INDEX,
+    )
+    return Zone.objects.filter(
+        Q(reschedule_from__isnull=True) | Q(reschedule_from__gt=first),
+        pk__in=zones.values('pk'),
+    ).update(reschedule_from=first)
+
+
+def reconcile_holidays(now=None):
+    """
+    Regenerate the checkpoints of the validated zones flagged by `mark_holiday_changes`.
+    Return the CheckpointGenerationResult of each zone.
+    """
+    zones = Zone.objects.filter(plan_state=Zone.PLAN_STATES[1][0], reschedule_from__isnull=False).order_by('pk')
+    return [generate_checkpoints(zone, now=now) for zone in zones]
+
+
+def materialize_checkpoints(weeks, now=None, chunk_size=200):
+    """
+    Extend the checkpoints of every validated zone up to `weeks` weeks ahead.
+
+    Only the days after `Zone.materialized_until` are generated, existing rows are never
+    touched, so running it repeatedly is cheap. Zones are handled by chunks, each chunk
+    in its own transaction.
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    horizon = today + datetime.timedelta(weeks=weeks)
+
+    pending = Zone.objects.filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=horizon),
+        plan_state=Zone.PLAN_STATES[1][0],
+    ).order_by('pk')
+    zone_ids = list(pending.values_list('pk', flat=True))
+    holidays = get_holiday_index()
+
+    created = 0
+    for offset in range(0, len(zone_ids), chunk_size):
+        chunk = zone_ids[offset:offset + chunk_size]
+        with transaction.atomic():
+            zones = list(Zone.objects.select_for_update().filter(pk__in=chunk).prefetch_related(
+                Prefetch('tag_set', queryset=Tag.objects.only('pk', 'zone')),
+                'planning_set',
+            ))
+            rows = []
+            rollup_keys = set()
+            for zone in zones:
+                start = max(zone.materialized_until or today, today)
+                if start >= horizon:
+                    continue
+                zone_rows = expand_schedule(zone.planning_set.all(), zone.tag_set.all(), zone.site_id, start, horizon,
+                                            not_before=now, holidays=holidays)
+                rollup_keys.update((zone.pk, local_day(row.check_datetime)) for row in zone_rows)
+                rows += zone_rows
+                zone.materialized_until = horizon
+            PatrolLog.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+            Zone.objects.bulk_update(zones, ['materialized_until'], batch_size=BULK_BATCH_SIZE)
+        refresh_rollups(rollup_keys, now)
+        created += len(rows)
+        checkpoints_planned.send(sender=Zone, zone_ids=chunk)
+
+    result = CheckpointGenerationResult(created=created, updated=0, deleted=0, duration=time.monotonic() - started)
+    logger.info('%s zones materialized up to %s: %s checkpoints generated in %.3fs',
+                len(zone_ids), horizon, result.created, result.duration)
+    return result
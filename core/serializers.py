@@ -1,40 +1,91 @@
+from django.db import models
 from django.utils import timezone
 from rest_framework import serializers
 
-from core.models import (Employee, Enterprise, Site, Tag, PatrolLog, Planning, Zone)
+from core.fieldsets import DynamicFieldsMixin
+from core.models import (AudioUpload, ComplianceRollup, Employee, Enterprise, MissedCheckpoint, Site, Tag, PatrolLog,
+                         Planning, Zone)
+from core.renderers import uses_native_values
+from core.tenancy import TenantScopedFieldsMixin
+from core.uploads import AUDIO_EXTENSIONS, AUDIO_UPLOAD_MAX_SIZE
 
 
-class EnterpriseSerializer(serializers.ModelSerializer):
+class NativeDateTimeField(serializers.DateTimeField):
+    def to_representation(self, value):
+        if uses_native_values(self.context):
+            return value
+        return super().to_representation(value)
+
+
+class NativeDurationField(serializers.DurationField):
+    def to_representation(self, value):
+        if uses_native_values(self.context):
+            return value
+        return super().to_representation(value)
+
+
+class ApiModelSerializer(TenantScopedFieldsMixin, DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Base serializer of the API models: related fields limited to the user's tenants, sparse
+    fieldsets, and datetimes and durations left as Python objects when the renderer
+    encodes them itself (MessagePack).
+    """
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DateTimeField: NativeDateTimeField,
+        models.DurationField: NativeDurationField,
+    }
+
+
+class EnterpriseSerializer(ApiModelSerializer):
     class Meta:
         model = Enterprise
         fields = ['id', 'designation', 'created', 'modified']
 
 
-class SiteSerializer(serializers.ModelSerializer):
+class SiteSerializer(ApiModelSerializer):
+    expandable_fields = {'enterprise': EnterpriseSerializer}
+
     class Meta:
         model = Site
         fields = ['id', 'designation', 'enterprise', 'created', 'modified']
 
 
-class ZoneSerializer(serializers.ModelSerializer):
+class ZoneSerializer(ApiModelSerializer):
+    expandable_fields = {'site': SiteSerializer}
+
     class Meta:
         model = Zone
         fields = ['id', 'designation', 'site', 'created', 'modified']
 
 
-class EmployeeSerializer(serializers.ModelSerializer):
+class EmployeeSerializer(ApiModelSerializer):
+    expandable_fields = {'site': SiteSerializer}
+
     class Meta:
         model = Employee
         fields = ['id', 'designation', 'code_pin', 'site', 'created', 'modified']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ApiModelSerializer):
+    expandable_fields = {'zone': ZoneSerializer}
+
     class Meta:
         model = Tag
         fields = ['id', 'zone', 'code_nfc', 'designation', 'order', 'observation', 'created', 'modified']
 
 
-class PatrolLogSerializer(serializers.ModelSerializer):
+class PlanningSerializer(ApiModelSerializer):
+    expandable_fields = {'zone': ZoneSerializer}
+
+    class Meta:
+        model = Planning
+        fields = '__all__'
+
+
+class PatrolLogSerializer(ApiModelSerializer):
+    expandable_fields = {'tag': TagSerializer, 'checked_by': EmployeeSerializer}
+
     zone_id = serializers.CharField(
         source='tag.zone.id',
         read_only=True,
@@ -55,13 +106,81 @@ class PatrolLogSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PatrolLog
-        fields = ['id', 'tag', 'audio_path', 'image_path', 'description_anomaly', 'zone_id', 'zone__designation',
-                  'tag__designation', 'tag__order', 'is_checked', 'created', 'modified', 'now', 'check_datetime',
-                  'check_tolerance', 'checked_datetime', 'checked_by'
+        fields = ['id', 'tag', 'audio_path', 'image_path', 'image_thumbnail', 'description_anomaly', 'zone_id',
+                  'zone__designation', 'tag__designation', 'tag__order', 'is_checked', 'created', 'modified', 'now',
+                  'check_datetime', 'check_tolerance', 'checked_datetime', 'checked_by'
                   ]
 
 
-class PlanningSerializer(serializers.ModelSerializer):
+class RoundCheckpointSerializer(serializers.ModelSerializer):
+    zone_id = serializers.IntegerField(source='tag.zone.id', read_only=True)
+    zone__designation = serializers.CharField(source='tag.zone.designation', read_only=True)
+    tag__designation = serializers.CharField(source='tag.designation', read_only=True)
+    tag__order = serializers.IntegerField(source='tag.order', read_only=True)
+
     class Meta:
-        model = Planning
-        fields = '__all__'
+        model = PatrolLog
+        fields = ['id', 'tag', 'zone_id', 'zone__designation', 'tag__designation', 'tag__order', 'check_datetime',
+                  'check_tolerance']
+
+
+class ScanSerializer(TenantScopedFieldsMixin, serializers.Serializer):
+    code_nfc = serializers.CharField(max_length=255)
+    employee = serializers.PrimaryKeyRelatedField(queryset=Employee.objects.all())
+    scanned_at = serializers.DateTimeField(required=False)
+
+
+class SyncScanSerializer(serializers.Serializer):
+    """A scan replayed by the offline sync, the employee is resolved in bulk by the caller."""
+    code_nfc = serializers.CharField(max_length=255)
+    employee = serializers.IntegerField()
+    scanned_at = serializers.DateTimeField()
+
+
+class MissedCheckpointSerializer(ApiModelSerializer):
+    expandable_fields = {'patrol_log': PatrolLogSerializer}
+
+    zone_id = serializers.IntegerField(source='patrol_log.tag.zone.id', read_only=True)
+    zone__designation = serializers.CharField(source='patrol_log.tag.zone.designation', read_only=True)
+    tag__designation = serializers.CharField(source='patrol_log.tag.designation', read_only=True)
+
+    class Meta:
+        model = MissedCheckpoint
+        fields = ['id', 'patrol_log', 'zone_id', 'zone__designation', 'tag__designation', 'due_datetime',
+                  'detected_datetime', 'created', 'modified']
+
+
+class ComplianceRollupSerializer(ApiModelSerializer):
+    expandable_fields = {'zone': ZoneSerializer, 'site': SiteSerializer, 'enterprise': EnterpriseSerializer}
+
+    class Meta:
+        model = ComplianceRollup
+        fields = ['id', 'day', 'zone', 'site', 'enterprise', 'planned', 'checked', 'late', 'missed', 'modified']
+
+
+class ComplianceTotalSerializer(serializers.Serializer):
+    """Rollups summed per day and per `group` (zone, site or enterprise)."""
+    day = serializers.DateField()
+    group = serializers.IntegerField()
+    planned = serializers.IntegerField()
+    checked = serializers.IntegerField()
+    late = serializers.IntegerField()
+    missed = serializers.IntegerField()
+
+
+class AudioUploadSerializer(ApiModelSerializer):
+    expandable_fields = {'patrol_log': PatrolLogSerializer}
+
+    class Meta:
+        model = AudioUpload
+        fields = ['id', 'patrol_log', 'filename', 'size', 'offset', 'completed', 'created', 'modified']
+
+    def validate_filename(self, value):
+        if not value.lower().endswith(AUDIO_EXTENSIONS):
+            raise serializers.ValidationError(f'Only audio files are accepted ({", ".join(AUDIO_EXTENSIONS)}).')
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= AUDIO_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'The size must be between 1 and {AUDIO_UPLOAD_MAX_SIZE} bytes.')
+        return value
@@ -0,0 +1,155 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_tokens, invalidate_user_tokens
+from core.caching import bump_model_version
+from core.compliance import local_day, refresh_rollups, tag_rollup_keys
+from core.deadlines import active_queues
+from core.models import (ArchivedPatrolLog, Employee, Enterprise, Holiday, MissedCheckpoint, PatrolLog, Planning, Site,
+                         Tag, TenantMembership, Zone)
+from core.permissions import invalidate_user_permissions
+from core.rounds import bump_round_version
+from core.scanning import tag_cache
+from core.scheduling import HOLIDAY_INDEX_CACHE_KEY, checkpoints_planned, mark_holiday_changes
+
+
+@receiver(pre_save, sender=Holiday)
+def remember_holiday_date(sender, instance, **kwargs):
+    instance.previous_date = Holiday.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Holiday)
+def reschedule_holiday(sender, instance, **kwargs):
+    cache.delete(HOLIDAY_INDEX_CACHE_KEY)
+    # Evict an index rebuilt by another request before this change was committed
+    transaction.on_commit(lambda: cache.delete(HOLIDAY_INDEX_CACHE_KEY))
+    # The checkpoints already generated on these dates are rescheduled by the materialize_checkpoints command
+    mark_holiday_changes({instance.date, getattr(instance, 'previous_date', None)} - {None})
+
+
+@receiver(post_save, sender=PatrolLog)
+def refresh_round_and_rollup(sender, instance, **kwargs):
+    bump_round_version(instance.site_id)
+    refresh_rollups({(instance.tag.zone_id, local_day(instance.check_datetime))})
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_rollups(sender, instance, **kwargs):
+    # The checkpoints of the tag are deleted by cascade, without signals
+    instance.rollup_keys = tag_rollup_keys(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def refresh_tag_rollups(sender, instance, **kwargs):
+    refresh_rollups(getattr(instance, 'rollup_keys', ()))
+
+
+@receiver([post_save, post_delete], sender=Enterprise)
+@receiver([post_save, post_delete], sender=Site)
+@receiver([post_save, post_delete], sender=Zone)
+@receiver([post_save, post_delete], sender=Employee)
+@receiver([post_save, post_delete], sender=Planning)
+def invalidate_reference_cache(sender, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def clear_tag_cache(sender, **kwargs):
+    tag_cache.clear()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Zone)
+def move_checkpoints(sender, instance, created, **kwargs):
+    # The denormalized site of the checkpoints follows their tag to its new zone or site
+    if created:
+        return
+    if sender is Tag:
+        tag_lookup, site_id = 'tag', Zone.objects.values_list('site_id', flat=True).get(pk=instance.zone_id)
+    else:
+        tag_lookup, site_id = 'tag__zone', instance.site_id
+    for model, prefix in ((PatrolLog, ''), (ArchivedPatrolLog, ''), (MissedCheckpoint, 'patrol_log__')):
+        model.objects.filter(**{prefix + tag_lookup: instance}).exclude(site_id=site_id).update(site_id=site_id)
+
+
+@receiver([post_save, post_delete], sender=TenantMembership)
+def invalidate_tenant_scopes(sender, **kwargs):
+    bump_model_version(TenantMembership)
+
+
+@receiver(post_save, sender=PatrolLog)
+def clear_missed_checkpoint(sender, instance, **kwargs):
+    if instance.is_checked:
+        MissedCheckpoint.objects.filter(patrol_log=instance).delete()
+
+
+@receiver(post_save, sender=PatrolLog)
+def update_deadline_queues(sender, instance, **kwargs):
+    for queue in list(active_queues):
+        if instance.is_checked:
+            queue.discard(instance.pk)
+        else:
+            queue.push(instance.pk, instance.due_datetime)
+
+
+@receiver(checkpoints_planned)
+def reload_deadline_queues(sender, zone_ids, **kwargs):
+    for queue in list(active_queues):
+        queue.push_zones(zone_ids)
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+def invalidate_users(user_ids):
+    user_ids = list(user_ids)
+    invalidate_user_tokens(user_ids)
+    invalidate_user_permissions(user_ids)
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permission_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_users([instance.pk])
+    elif reverse and action in ('post_add', 'post_remove'):
+        invalidate_users(pk_set)
+    elif reverse and action == 'pre_clear':
+        # group.user_set.clear() / permission.user_set.clear(): the users are only known before
+        invalidate_users(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permission_changes(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        groups = [instance.pk]
+    elif reverse and action in ('post_add', 'post_remove'):
+        groups = pk_set
+    elif reverse and action == 'pre_clear':
+        groups = instance.group_set.values_list('pk', flat=True)
+    else:
+        return
+    bump_model_version(Group)
+    invalidate_user_tokens(User.objects.filter(groups__in=groups).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_deleted_group(sender, instance, **kwargs):
+    bump_model_version(Group)
+    invalidate_user_tokens(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Permission)
+def invalidate_permissions(sender, **kwargs):
+    bump_model_version(Permission)
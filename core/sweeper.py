@@ -0,0 +1,44 @@
+"""
+Missed checkpoint detection.
+
+Each sweep records as MissedCheckpoint the unchecked PatrolLog whose due time
+(check_datetime + check_tolerance) fell between the end of the previous sweep and now.
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.compliance import local_day, refresh_rollups
+from core.models import CheckpointSweep, MissedCheckpoint, PatrolLog
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+SWEEP_FIRST_WINDOW = datetime.timedelta(minutes=getattr(settings, 'SWEEP_FIRST_WINDOW_MINUTES', 24 * 60))
+
+
+def sweep_missed_checkpoints(now=None):
+    """Record the checkpoints missed since the previous sweep and return the new CheckpointSweep."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        last_sweep = CheckpointSweep.objects.select_for_update().order_by('-window_end').first()
+        window_start = last_sweep.window_end if last_sweep else now - SWEEP_FIRST_WINDOW
+        overdue = PatrolLog.objects.filter(
+            is_checked=False,
+            due_datetime__gt=window_start,
+            due_datetime__lte=now,
+        ).values_list('pk', 'site_id', 'due_datetime', 'tag__zone_id', 'check_datetime')
+        missed = []
+        rollup_keys = set()
+        for pk, site_id, due_datetime, zone_id, check_datetime in overdue:
+            missed.append(MissedCheckpoint(patrol_log_id=pk, site_id=site_id, due_datetime=due_datetime,
+                                           detected_datetime=now))
+            rollup_keys.add((zone_id, local_day(check_datetime)))
+        MissedCheckpoint.objects.bulk_create(missed, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+        refresh_rollups(rollup_keys, now)
+        sweep = CheckpointSweep.objects.create(window_start=window_start, window_end=now, missed_count=len(missed))
+    logger.info('%s missed checkpoints between %s and %s', len(missed), window_start, now)
+    return sweep
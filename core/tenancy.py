@@ -0,0 +1,119 @@
+"""
+Tenant scoping of the data.
+
+A user only sees the enterprises and sites of their TenantMembership rows, superusers see
+everything. The scope is resolved once per user (cached under the versions of
+TenantMembership and Site when the cache is shared, see core.caching) and applied to the querysets of the API
+and of the views as a filter on the site of every row. The large tables carry their
+site (PatrolLog, ArchivedPatrolLog, MissedCheckpoint, ComplianceRollup) in indexes
+leading with it, so a tenant's queries only read that tenant's rows.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from core.caching import cache_is_shared, get_model_versions
+from core.models import (ArchivedPatrolLog, AudioUpload, ComplianceRollup, Employee, Enterprise, MissedCheckpoint,
+                         PatrolLog, Planning, Site, Tag, TenantMembership, Zone)
+
+TENANT_SCOPE_TTL = getattr(settings, 'TENANT_SCOPE_TTL', 60 * 60)
+
+TenantScope = namedtuple('TenantScope', ['enterprise_ids', 'site_ids'])
+
+# model: lookup of its enterprise ('enterprise', ...) or of its site ('site', ...)
+TENANT_LOOKUPS = {
+    Enterprise: ('enterprise', 'pk'),
+    Site: ('site', 'pk'),
+    Zone: ('site', 'site_id'),
+    Employee: ('site', 'site_id'),
+    Tag: ('site', 'zone__site_id'),
+    Planning: ('site', 'zone__site_id'),
+    PatrolLog: ('site', 'site_id'),
+    ArchivedPatrolLog: ('site', 'site_id'),
+    MissedCheckpoint: ('site', 'site_id'),
+    ComplianceRollup: ('site', 'site_id'),
+    AudioUpload: ('site', 'patrol_log__site_id'),
+}
+
+
+def get_tenant_scope(user):
+    """Return the TenantScope of `user`, None when they see every tenant."""
+    if user.is_superuser:
+        return None
+    if not user.is_authenticated:
+        return TenantScope(frozenset(), frozenset())
+    if not hasattr(user, '_tenant_scope'):
+        if cache_is_shared():
+            versions = '.'.join(str(version) for version in get_model_versions([TenantMembership, Site]))
+            key = f'core:tenant-scope:{versions}:{user.pk}'
+            scope = cache.get(key)
+            if scope is None:
+                scope = load_tenant_scope(user)
+                cache.set(key, scope, TENANT_SCOPE_TTL)
+        else:
+            scope = load_tenant_scope(user)
+        user._tenant_scope = scope
+    return user._tenant_scope
+
+
+def load_tenant_scope(user):
+    memberships = list(TenantMembership.objects.filter(user=user).values_list('enterprise_id', 'site_id'))
+    whole_enterprises = [enterprise_id for enterprise_id, site_id in memberships if site_id is None]
+    sites = [site_id for _, site_id in memberships if site_id is not None]
+    site_ids = Site.objects.filter(Q(enterprise_id__in=whole_enterprises) | Q(pk__in=sites)).values_list(
+        'pk', flat=True)
+    return TenantScope(frozenset(enterprise_id for enterprise_id, _ in memberships), frozenset(site_ids))
+
+
+def scope_queryset(queryset, user):
+    """Restrict `queryset` to the tenants of `user`, the models without tenant are left untouched."""
+    scope = get_tenant_scope(user)
+    if scope is None or queryset.model not in TENANT_LOOKUPS:
+        return queryset
+    kind, lookup = TENANT_LOOKUPS[queryset.model]
+    ids = scope.enterprise_ids if kind == 'enterprise' else scope.site_ids
+    return queryset.filter(**{f'{lookup}__in': sorted(ids)})
+
+
+def get_scope_key(user):
+    """A short string identifying the scope of `user`, for the cache keys of scoped data."""
+    scope = get_tenant_scope(user)
+    if scope is None:
+        return 'all'
+    return ','.join(str(site_id) for site_id in sorted(scope.site_ids)) + ':' + ','.join(
+        str(enterprise_id) for enterprise_id in sorted(scope.enterprise_ids))
+
+
+class TenantScopedFieldsMixin:
+    """Serializer mixin restricting the choices of its related fields to the tenants of the user of the request."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is not None:
+            for field in fields.values():
+                if getattr(field, 'queryset', None) is not None:
+                    field.queryset = scope_queryset(field.queryset, request.user)
+        return fields
+
+
+class TenantScopedMixin:
+    """
+    Restrict the queryset of a viewset or a class-based view, and the choices of the
+    forms of the views, to the tenants of the user of the request.
+    """
+
+    def get_queryset(self):
+        return scope_queryset(super().get_queryset(), self.request.user)
+
+    def get_scope_key(self):
+        return get_scope_key(self.request.user)
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        for field in form.fields.values():
+            if getattr(field, 'queryset', None) is not None:
+                field.queryset = scope_queryset(field.queryset, self.request.user)
+        return form
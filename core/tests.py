@@ -1,3 +1,1084 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from core.archive import ARCHIVE_BOUNDARY_CACHE_KEY, ARCHIVED_FIELDS, archive_patrol_logs, get_archive_boundary
+from core.authentication import token_cache_key
+from core.deadlines import DeadlineQueue
+from core.exports import PATROL_LOG_COLUMNS
+from core.images import PROCESSED_NAME_RE, process_patrol_log_image
+from core.models import (HOLIDAY_DAY_INDEX, ArchivedPatrolLog, AudioUpload, ComplianceRollup, Employee, Enterprise,
+                         Holiday, MissedCheckpoint, PatrolLog, Planning, Site, Tag, TenantMembership, Zone)
+from core.scheduling import generate_checkpoints, get_holiday_index, materialize_checkpoints, reconcile_holidays
+from core.sweeper import sweep_missed_checkpoints
+from core.uploads import UploadError, append_chunk
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    Assert that an API call runs a fixed number of queries whatever the number of rows.
+
+    Subclasses implement `create_rows` and call `assertQueryBudget` on their endpoints;
+    the call is replayed after each batch of rows so an N+1 shows up as a failure.
+    """
+    row_counts = (1, 10, 50)
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+
+    def create_rows(self, count):
+        raise NotImplementedError
+
+    def assertQueryBudget(self, url_factory, budget):
+        created = 0
+        for count in self.row_counts:
+            self.create_rows(count - created)
+            created = count
+            url = url_factory()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+
+class PatrolLogQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        enterprise = Enterprise.objects.create(designation='Enterprise')
+        site = Site.objects.create(designation='Site', enterprise=enterprise)
+        self.zone = Zone.objects.create(designation='Zone', site=site)
+        # The archive boundary is cached by the first read
+        cache.delete(ARCHIVE_BOUNDARY_CACHE_KEY)
+        get_archive_boundary()
+
+    def create_rows(self, count):
+        now = timezone.now()
+        for index in range(count):
+            tag = Tag.objects.create(zone=self.zone, code_nfc=f'nfc-{now.timestamp()}-{index}',
+                                     designation=f'Tag {index}', order=index, observation='')
+            log = PatrolLog.objects.create(tag=tag, check_datetime=now + datetime.timedelta(minutes=index),
+                                           check_tolerance=datetime.timedelta(minutes=10))
+            if getattr(self, 'archive', False):
+                ArchivedPatrolLog.objects.create(
+                    id=-log.pk, tag=tag, site_id=log.site_id, check_datetime=log.check_datetime - datetime.timedelta(days=365),
+                    check_tolerance=log.check_tolerance, created=log.created, modified=log.modified)
+                cache.delete(ARCHIVE_BOUNDARY_CACHE_KEY)
+
+    def test_list_query_budget(self):
+        self.assertQueryBudget(lambda: '/core/api/patrol-logs/', 1)
+
+    def test_sparse_list_query_budget(self):
+        self.archive = True
+        # Archive boundary, live page and archived page, the cursors and the merge use loaded keys
+        self.assertQueryBudget(lambda: '/core/api/patrol-logs/?page_size=50&fields=id', 3)
+
+    def test_retrieve_query_budget(self):
+        self.assertQueryBudget(lambda: f'/core/api/patrol-logs/{PatrolLog.objects.latest("id").pk}/', 1)
+
+
+class PatrolLogFilterTests(APITestCase):
+
+    def setUp(self):
+        cache.delete(ARCHIVE_BOUNDARY_CACHE_KEY)
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        enterprise = Enterprise.objects.create(designation='Enterprise')
+        self.sites = [Site.objects.create(designation=f'Site {index}', enterprise=enterprise) for index in range(2)]
+        self.zones = [Zone.objects.create(designation='Zone', site=site) for site in self.sites]
+        self.employee = Employee.objects.create(designation='Guard', code_pin='1234', site=self.sites[0])
+        self.day = timezone.localdate() + datetime.timedelta(days=2)
+        self.logs = {}
+        self.next_day = self.day + datetime.timedelta(days=1)
+        for name, zone, hour, day in (('morning', 0, 10, self.day), ('midnight', 0, 0, self.next_day),
+                                      ('other site', 1, 12, self.day)):
+            tag = Tag.objects.create(zone=self.zones[zone], code_nfc=name, designation='Tag', order=1, observation='')
+            self.logs[name] = PatrolLog.objects.create(
+                tag=tag, check_datetime=timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour))),
+                check_tolerance=datetime.timedelta(minutes=10))
+        PatrolLog.objects.filter(pk=self.logs['morning'].pk).update(is_checked=True, checked_by=self.employee)
+
+    def assertFiltered(self, params, names):
+        response = self.client.get('/core/api/patrol-logs/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual({row['id'] for row in response.data['results']}, {self.logs[name].pk for name in names},
+                         params)
+
+    def test_ids(self):
+        self.assertFiltered({'zone': self.zones[0].pk}, ['morning', 'midnight'])
+        self.assertFiltered({'site': self.sites[1].pk}, ['other site'])
+        self.assertFiltered({'employee': self.employee.pk}, ['morning'])
+        self.assertFiltered({'zone': self.zones[0].pk, 'site': self.sites[1].pk}, [])
+
+    def test_is_checked(self):
+        self.assertFiltered({'is_checked': 'true'}, ['morning'])
+        self.assertFiltered({'is_checked': '0'}, ['midnight', 'other site'])
+
+    def test_period(self):
+        next_day = self.next_day.isoformat()
+        self.assertFiltered({'from': next_day}, ['midnight'])
+        # `to` is exclusive, as a date (midnight) or as a datetime
+        self.assertFiltered({'to': next_day}, ['morning', 'other site'])
+        self.assertFiltered({'to': self.logs['other site'].check_datetime.isoformat()}, ['morning'])
+        self.assertFiltered({'from': self.logs['morning'].check_datetime.isoformat(),
+                             'to': self.logs['midnight'].check_datetime.isoformat()}, ['morning', 'other site'])
+
+    def test_malformed_parameters(self):
+        for param, value in (('zone', 'x'), ('employee', '1.5'), ('from', '2024-13-01'), ('to', 'tomorrow'),
+                             ('is_checked', 'maybe')):
+            response = self.client.get('/core/api/patrol-logs/', {param: value})
+            self.assertEqual(response.status_code, 400, param)
+            self.assertIn(param, response.data)
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        tag = Tag.objects.create(zone=zone, code_nfc='nfc', designation='Tag', order=1, observation='')
+        now = timezone.now()
+        # Three checkpoints share the same time and are only ordered by id
+        last, *tied, first = [PatrolLog.objects.create(
+            tag=tag, check_datetime=now + datetime.timedelta(minutes=minutes),
+            check_tolerance=datetime.timedelta(minutes=10)).pk for minutes in (5, 1, 1, 1, 0)]
+        self.ids = [first, *tied, last]
+
+    def pages(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).data
+            pages.append([row['id'] for row in data['results']])
+            url = data[link]
+        return pages
+
+    def test_forward_and_backward_pages(self):
+        pages = self.pages('/core/api/patrol-logs/?page_size=2', 'next')
+        self.assertEqual(pages, [self.ids[0:2], self.ids[2:4], self.ids[4:]])
+        last_page = self.client.get('/core/api/patrol-logs/?page_size=2').data
+        for _ in range(2):
+            last_page = self.client.get(last_page['next']).data
+        self.assertEqual(self.pages(last_page['previous'], 'previous'), [self.ids[2:4], self.ids[0:2]])
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'e30=', 'eyJkIjogIm5vdCBhIGRhdGUiLCAiaSI6IDEsICJyIjogZmFsc2V9'):
+            response = self.client.get(f'/core/api/patrol-logs/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+@override_settings(CACHE_SHARED=True)
+class ReferenceCacheTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.enterprise = Enterprise.objects.create(designation='Enterprise')
+        self.site = Site.objects.create(designation='Site', enterprise=self.enterprise)
+
+    def test_warm_cache_runs_no_query(self):
+        for url in ('/core/api/sites/', f'/core/api/sites/{self.site.pk}/'):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_save_and_delete_invalidate(self):
+        self.client.get('/core/api/sites/')
+        self.client.get(f'/core/api/sites/{self.site.pk}/')
+        self.site.designation = 'Renamed'
+        self.site.save()
+        self.assertEqual(self.client.get('/core/api/sites/').data[0]['designation'], 'Renamed')
+        self.assertEqual(self.client.get(f'/core/api/sites/{self.site.pk}/').data['designation'], 'Renamed')
+        self.enterprise.delete()
+        self.assertEqual(self.client.get('/core/api/sites/').data, [])
+        self.assertEqual(self.client.get(f'/core/api/sites/{self.site.pk}/').status_code, 404)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_is_not_used(self):
+        self.client.get('/core/api/sites/')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/core/api/sites/').status_code, 200)
+
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        self.tag = Tag.objects.create(zone=zone, code_nfc='nfc', designation='Tag', order=1, observation='')
+
+    def assertNotModifiedUntilChange(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        if response.has_header('Last-Modified'):
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list(self):
+        self.assertNotModifiedUntilChange('/core/api/tags/', lambda: Tag.objects.create(
+            zone=self.tag.zone, code_nfc='other', designation='Other', order=2, observation=''))
+
+    def test_detail(self):
+        def change():
+            self.tag.designation = 'Renamed'
+            self.tag.save()
+        self.assertNotModifiedUntilChange(f'/core/api/tags/{self.tag.pk}/', change)
+
+    def test_cached_reference_list(self):
+        def change():
+            self.tag.zone.designation = 'Renamed'
+            self.tag.zone.save()
+        self.assertNotModifiedUntilChange('/core/api/zones/', change)
+
+    def test_list_deletion(self):
+        other = Tag.objects.create(zone=self.tag.zone, code_nfc='other', designation='Other', order=2, observation='')
+        response = self.client.get('/core/api/tags/')
+        # The latest modification of a list would not change with a deletion
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertTrue(self.client.get(f'/core/api/tags/{self.tag.pk}/').has_header('Last-Modified'))
+        self.assertNotModifiedUntilChange('/core/api/tags/', other.delete)
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        for order in range(5):
+            Tag.objects.create(zone=self.zone, code_nfc=f'nfc{order}', designation='Tag', order=order, observation='')
+
+    def test_fields_and_nested_expand(self):
+        # The validators aggregate, then a single query joins the expanded relations
+        with self.assertNumQueries(2):
+            response = self.client.get('/core/api/tags/?fields=id,zone&expand=zone.site')
+        self.assertEqual(response.status_code, 200)
+        row = response.json()[0]
+        self.assertEqual(set(row), {'id', 'zone'})
+        self.assertEqual(row['zone']['designation'], 'Zone')
+        self.assertEqual(row['zone']['site']['designation'], 'Site')
+
+    def test_expanded_relation_changes_validators(self):
+        url = '/core/api/tags/?expand=zone'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.zone.designation = 'Renamed'
+        self.zone.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_ignore_fieldsets(self):
+        for index, query in enumerate(('fields=id', 'expand=zone')):
+            response = self.client.post(f'/core/api/tags/?{query}', {
+                'zone': self.zone.pk, 'code_nfc': f'new{index}', 'designation': 'New', 'order': 9, 'observation': 'New'})
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertEqual(response.data['zone'], self.zone.pk)
+
+
+class MessagePackTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        self.zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        self.tag = Tag.objects.create(zone=self.zone, code_nfc='nfc', designation='Tag', order=1, observation='')
+        self.patrol_log = PatrolLog.objects.create(tag=self.tag, check_datetime=timezone.now(),
+                                                   check_tolerance=datetime.timedelta(minutes=10))
+
+    def test_native_datetimes_and_durations(self):
+        response = self.client.get(f'/core/api/patrol-logs/{self.patrol_log.pk}/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content, timestamp=3)
+        self.assertEqual(data['check_datetime'], self.patrol_log.check_datetime)
+        self.assertEqual(data['check_tolerance'], 600)
+
+    def test_column_layout(self):
+        response = self.client.get('/core/api/tags/?fields=id,order',
+                                   HTTP_ACCEPT='application/msgpack; layout=columns')
+        self.assertEqual(msgpack.unpackb(response.content), {'id': [self.tag.pk], 'order': [1]})
+
+    def test_column_layout_shape_is_stable(self):
+        accept = 'application/msgpack; layout=columns'
+        page = msgpack.unpackb(self.client.get('/core/api/patrol-logs/?is_checked=true', HTTP_ACCEPT=accept).content)
+        self.assertEqual(page['results'], {})
+        scans = [{'code_nfc': 'unknown', 'employee': 0, 'scanned_at': timezone.now().isoformat()}, {}]
+        response = self.client.post('/core/api/patrol-logs/sync/', msgpack.packb(scans),
+                                    content_type='application/msgpack', HTTP_ACCEPT=accept)
+        results = msgpack.unpackb(response.content)
+        self.assertEqual(results['status'], ['unknown_employee', 'invalid'])
+        self.assertEqual(results['index'], [0, 1])
+        self.assertIsNone(results['errors'][0])
+
+    def test_parser(self):
+        content = msgpack.packb({'zone': self.zone.pk, 'code_nfc': 'other', 'designation': 'Other', 'order': 2,
+                                 'observation': 'Entrance'})
+        response = self.client.post('/core/api/tags/', content, content_type='application/msgpack',
+                                    HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['code_nfc'], 'other')
+
+
+@override_settings(CACHE_SHARED=True)
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('guard', 'guard@example.com', 'password')
+        self.user.user_permissions.add(Permission.objects.get(codename='view_site'))
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        Site.objects.create(designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))
+        self.client.get('/core/api/sites/')
+
+    def test_cached_token_runs_no_query(self):
+        self.assertIsNotNone(cache.get(token_cache_key(self.token.key)))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/core/api/sites/').status_code, 200)
+
+    def test_invalidation(self):
+        self.user.user_permissions.clear()
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+        self.client.get('/core/api/sites/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/core/api/sites/').status_code, 401)
+        self.user.is_active = True
+        self.user.save()
+        self.client.get('/core/api/sites/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/core/api/sites/').status_code, 401)
+
+
+@override_settings(CACHE_SHARED=True)
+class CachedPermissionTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('guard', 'guard@example.com', 'password')
+        self.group = Group.objects.create(name='Guards')
+        self.user.groups.add(self.group)
+
+    def has_perm(self, perm):
+        # A new instance per check, as every request loads its own user
+        return User.objects.get(pk=self.user.pk).has_perm(perm)
+
+    def test_warm_permissions_run_no_query(self):
+        self.has_perm('core.view_site')
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(user.has_perm('core.view_site'))
+            self.assertFalse(user.has_module_perms('core'))
+
+    def test_invalidation(self):
+        self.assertFalse(self.has_perm('core.view_site'))
+        self.group.permissions.add(Permission.objects.get(codename='view_site'))
+        self.assertTrue(self.has_perm('core.view_site'))
+        self.user.user_permissions.add(Permission.objects.get(codename='view_zone'))
+        self.assertTrue(self.has_perm('core.view_zone'))
+        self.group.user_set.clear()
+        self.assertFalse(self.has_perm('core.view_site'))
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_is_not_used(self):
+        self.has_perm('core.view_site')
+        # The user, then its own and its groups' permissions
+        with self.assertNumQueries(3):
+            self.assertFalse(self.has_perm('core.view_site'))
+
+
+class TenantScopeTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', 'client@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        enterprise = Enterprise.objects.create(designation='Enterprise')
+        self.site, self.other_site = (Site.objects.create(designation=designation, enterprise=enterprise)
+                                      for designation in ('Site', 'Other site'))
+        self.tags = [Tag.objects.create(zone=Zone.objects.create(designation='Zone', site=site),
+                                        code_nfc=f'nfc{site.pk}', designation='Tag', order=1, observation='')
+                     for site in (self.site, self.other_site)]
+        for tag in self.tags:
+            PatrolLog.objects.create(tag=tag, check_datetime=timezone.now(),
+                                     check_tolerance=datetime.timedelta(minutes=10))
+        TenantMembership.objects.create(user=self.user, enterprise=enterprise, site=self.site)
+
+    def test_rows_of_other_sites_are_hidden(self):
+        self.assertEqual([site['id'] for site in self.client.get('/core/api/sites/').data], [self.site.pk])
+        patrol_logs = self.client.get('/core/api/patrol-logs/').data['results']
+        self.assertEqual([patrol_log['tag'] for patrol_log in patrol_logs], [self.tags[0].pk])
+        other_log = PatrolLog.objects.get(tag=self.tags[1])
+        self.assertEqual(self.client.get(f'/core/api/patrol-logs/{other_log.pk}/').status_code, 404)
+
+    def test_patrol_logs_follow_their_tag(self):
+        patrol_log = PatrolLog.objects.get(tag=self.tags[1])
+        self.assertEqual(patrol_log.site_id, self.other_site.pk)
+        self.tags[1].zone = self.tags[0].zone
+        self.tags[1].save()
+        patrol_log.refresh_from_db()
+        self.assertEqual(patrol_log.site_id, self.site.pk)
+        self.assertEqual(len(self.client.get('/core/api/patrol-logs/').data['results']), 2)
+
+
+class InterruptedStream(io.BytesIO):
+    """A request body whose connection drops once its content is read."""
+
+    def read(self, size=-1):
+        block = super().read(size)
+        if not block:
+            raise OSError('Connection reset')
+        return block
+
+
+class AudioUploadTests(APITestCase):
+    memo = b'ID3' + bytes(range(256)) * 400
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        tag = Tag.objects.create(zone=zone, code_nfc='nfc', designation='Tag', order=1, observation='')
+        self.patrol_log = PatrolLog.objects.create(tag=tag, check_datetime=timezone.now(),
+                                                   check_tolerance=datetime.timedelta(minutes=10))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        upload_dir = mock.patch('core.uploads.AUDIO_UPLOAD_DIR', os.path.join(self.media_root, 'parts'))
+        upload_dir.start()
+        self.addCleanup(upload_dir.stop)
+
+    def start(self, filename='memo.MP3', size=None):
+        return self.client.post('/core/api/audio-uploads/', {
+            'patrol_log': self.patrol_log.pk, 'filename': filename, 'size': size or len(self.memo)}, format='json')
+
+    def send(self, upload_id, offset, content):
+        return self.client.put(f'/core/api/audio-uploads/{upload_id}/chunk/', content,
+                               content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resume_after_errors(self):
+        upload_id = self.start().data['id']
+        self.assertEqual(self.send(upload_id, 0, self.memo[:1000]).data['offset'], 1000)
+        response = self.send(upload_id, 0, self.memo[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '1000')
+        response = self.send(upload_id, 1000, self.memo[1000:] + b'x')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response['Upload-Offset'], '1000')
+        # An interrupted chunk keeps the bytes received, the client resumes from them
+        with self.assertRaises(UploadError):
+            append_chunk(upload_id, 1000, InterruptedStream(self.memo[1000:2000]))
+        offset = self.client.get(f'/core/api/audio-uploads/{upload_id}/').data['offset']
+        self.assertEqual(offset, 2000)
+
+        response = self.send(upload_id, offset, self.memo[offset:])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['completed'])
+        self.patrol_log.refresh_from_db()
+        self.assertTrue(self.patrol_log.audio_path.endswith('.mp3'))
+        with open(os.path.join(self.media_root, self.patrol_log.audio_path[len('/media/'):]), 'rb') as stored:
+            self.assertEqual(stored.read(), self.memo)
+        self.assertEqual(self.send(upload_id, len(self.memo), b'x').status_code, 409)
+
+    def test_only_audio_is_accepted(self):
+        self.assertEqual(self.start(filename='memo.html').status_code, 400)
+        content = b'<svg onload="alert(1)"></svg>'
+        upload_id = self.start(filename='memo.m4a', size=len(content)).data['id']
+        self.assertEqual(self.send(upload_id, 0, content).status_code, 415)
+        self.assertFalse(AudioUpload.objects.filter(pk=upload_id).exists())
+        self.patrol_log.refresh_from_db()
+        self.assertIsNone(self.patrol_log.audio_path)
+
+
+class MediaTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.media_root = directory.name
+        with open(os.path.join(directory.name, 'photo.jpg'), 'wb') as photo:
+            photo.write(b'0123456789')
+
+    def test_accept_header_is_ignored(self):
+        for accept in ('image/jpeg', 'audio/*', 'application/json'):
+            response = self.client.get('/media/photo.jpg', HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, 200, accept)
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(self.client.get('/media/missing.jpg', HTTP_ACCEPT='image/jpeg').status_code, 404)
+
+    def assertRange(self, response, content_range, content):
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], content_range)
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_ranges(self):
+        self.assertRange(self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=2-5'), 'bytes 2-5/10', b'2345')
+        self.assertRange(self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=7-'), 'bytes 7-9/10', b'789')
+        self.assertRange(self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=-3'), 'bytes 7-9/10', b'789')
+        response = self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=20-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+        # Several ranges are answered with the whole file
+        response = self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_if_range(self):
+        etag = self.client.get('/media/photo.jpg')['ETag']
+        self.assertRange(self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE=etag),
+                         'bytes 2-5/10', b'2345')
+        response = self.client.get('/media/photo.jpg', HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Range', response)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+    def test_not_modified(self):
+        response = self.client.get('/media/photo.jpg')
+        response = self.client.get('/media/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=86400')
+
+    def test_offloaded_transfers(self):
+        with mock.patch('core.media.MEDIA_ACCEL_REDIRECT', 'x-accel-redirect'):
+            response = self.client.get('/media/photo.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/photo.jpg')
+        self.assertEqual(response.content, b'')
+        with mock.patch('core.media.MEDIA_ACCEL_REDIRECT', 'x-sendfile'):
+            response = self.client.get('/media/photo.jpg')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'photo.jpg'))
+
+    def test_tenant_scope(self):
+        enterprise = Enterprise.objects.create(designation='Enterprise')
+        site, other_site = (Site.objects.create(designation=designation, enterprise=enterprise)
+                            for designation in ('Site', 'Other site'))
+        user = User.objects.create_user('client', 'client@example.com', 'password')
+        user.user_permissions.add(Permission.objects.get(codename='view_patrollog'))
+        TenantMembership.objects.create(user=user, enterprise=enterprise, site=site)
+        self.client.force_authenticate(User.objects.get(pk=user.pk))
+        tag = Tag.objects.create(zone=Zone.objects.create(designation='Zone', site=other_site), code_nfc='nfc',
+                                 designation='Tag', order=1, observation='')
+        patrol_log = PatrolLog.objects.create(tag=tag, check_datetime=timezone.now(), image_path='photo.jpg',
+                                              check_tolerance=datetime.timedelta(minutes=10))
+        self.assertEqual(self.client.get('/media/photo.jpg').status_code, 404)
+        tag.zone = Zone.objects.create(designation='Zone', site=site)
+        tag.save()
+        self.assertEqual(self.client.get('/media/photo.jpg').status_code, 200)
+        PatrolLog.objects.filter(pk=patrol_log.pk).update(image_path='other.jpg')
+        self.assertEqual(self.client.get('/media/photo.jpg').status_code, 404)
+
+
+class CheckpointScheduleTests(APITestCase):
+
+    def setUp(self):
+        self.zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        self.tags = [Tag.objects.create(zone=self.zone, code_nfc=f'nfc{order}', designation='Tag', order=order,
+                                        observation='') for order in range(2)]
+        for day_index in list(range(7)) + [HOLIDAY_DAY_INDEX]:
+            Planning(zone=self.zone, selected_day_index=day_index,
+                     patrol_check_time=datetime.time(12 if day_index == HOLIDAY_DAY_INDEX else 23, 59),
+                     tolerated_time=datetime.timedelta(minutes=10)).save()
+
+    def check_times(self, day):
+        return set(PatrolLog.objects.filter(check_datetime__date=day).values_list('check_datetime__hour', flat=True))
+
+    def test_holidays_reschedule_materialized_days(self):
+        self.zone.validate_plan()
+        materialize_checkpoints(2)
+        day = timezone.localdate() + datetime.timedelta(days=3)
+        self.assertEqual(self.check_times(day), {23})
+        holiday = Holiday.objects.create(designation='Holiday', date=day)
+        # Rescheduled by the next materialize_checkpoints run, not by the request saving the holiday
+        self.assertEqual(self.check_times(day), {23})
+        call_command('materialize_checkpoints', weeks=2, stdout=io.StringIO())
+        self.assertEqual(self.check_times(day), {12})
+        self.assertEqual(PatrolLog.objects.filter(check_datetime__date=day).count(), len(self.tags))
+        holiday.delete()
+        self.assertEqual(len(reconcile_holidays()), 1)
+        self.assertEqual(self.check_times(day), {23})
+        self.assertEqual(reconcile_holidays(), [])
+
+    def test_confirm_clears_holiday_changes(self):
+        self.zone.validate_plan()
+        materialize_checkpoints(2)
+        Holiday.objects.create(designation='Holiday', date=timezone.localdate() + datetime.timedelta(days=3))
+        self.assertIsNotNone(Zone.objects.get(pk=self.zone.pk).reschedule_from)
+        self.zone.create_planned_checkpoints()
+        self.assertEqual(reconcile_holidays(), [])
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_keeps_no_holiday_index(self):
+        get_holiday_index()
+        Holiday.objects.bulk_create([Holiday(designation='Holiday', date=timezone.localdate())])
+        self.assertEqual(get_holiday_index(), {timezone.localdate().year: frozenset([timezone.localdate()])})
+
+    def test_materialize(self):
+        draft = Zone.objects.create(designation='Draft', site=self.zone.site)
+        Tag.objects.create(zone=draft, code_nfc='draft', designation='Tag', order=1, observation='')
+        Planning(zone=draft, selected_day_index=0, patrol_check_time=datetime.time(23, 59),
+                 tolerated_time=datetime.timedelta(minutes=10)).save()
+        self.zone.validate_plan()
+        now = timezone.now()
+        today = timezone.localdate(now)
+
+        result = materialize_checkpoints(1, now=now)
+        self.assertEqual(result.created, PatrolLog.objects.count())
+        self.assertGreater(result.created, 0)
+        self.assertEqual(Zone.objects.get(pk=self.zone.pk).materialized_until, today + datetime.timedelta(weeks=1))
+        self.assertEqual(materialize_checkpoints(1, now=now).created, 0)
+
+        # Only the days past the previous horizon are added
+        self.assertEqual(materialize_checkpoints(2, now=now).created, 7 * len(self.tags))
+        self.assertEqual(Zone.objects.get(pk=self.zone.pk).materialized_until, today + datetime.timedelta(weeks=2))
+        self.assertEqual(PatrolLog.objects.values('tag', 'check_datetime').distinct().count(),
+                         PatrolLog.objects.count())
+        draft.refresh_from_db()
+        self.assertIsNone(draft.materialized_until)
+        self.assertFalse(PatrolLog.objects.filter(tag__zone=draft).exists())
+
+    def test_regeneration_reconciles_checkpoints(self):
+        now = timezone.now()
+        generate_checkpoints(self.zone, now=now)
+        day = timezone.localdate(now) + datetime.timedelta(days=3)
+        checkpoints = PatrolLog.objects.filter(check_datetime__date=day)
+        ids = set(checkpoints.values_list('pk', flat=True))
+        self.assertEqual(len(ids), len(self.tags))
+
+        result = generate_checkpoints(self.zone, now=now)
+        self.assertEqual((result.created, result.updated, result.deleted), (0, 0, 0))
+
+        plannings = Planning.objects.filter(zone=self.zone, selected_day_index=day.weekday())
+        plannings.update(tolerated_time=datetime.timedelta(minutes=20))
+        result = generate_checkpoints(self.zone, now=now)
+        self.assertEqual((result.created, result.updated, result.deleted), (0, len(self.tags), 0))
+        self.assertEqual(set(checkpoints.values_list('pk', 'check_tolerance')),
+                         {(pk, datetime.timedelta(minutes=20)) for pk in ids})
+
+        # Moved checkpoints are replaced, except the ones already checked
+        checked = min(ids)
+        PatrolLog.objects.filter(pk=checked).update(is_checked=True)
+        plannings.update(patrol_check_time=datetime.time(22, 0))
+        result = generate_checkpoints(self.zone, now=now)
+        self.assertEqual((result.created, result.updated, result.deleted), (len(self.tags), 0, len(self.tags) - 1))
+        self.assertEqual(self.check_times(day), {22, 23})
+        self.assertEqual(list(checkpoints.filter(check_datetime__hour=23).values_list('pk', flat=True)), [checked])
+
+
+class ScanTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_authenticate(self.user)
+        site = Site.objects.create(designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))
+        self.employee = Employee.objects.create(designation='Guard', code_pin='1234', site=site)
+        self.tag = Tag.objects.create(zone=Zone.objects.create(designation='Zone', site=site), code_nfc='nfc',
+                                      designation='Tag', order=1, observation='')
+        self.check_datetime = timezone.now().replace(microsecond=0) + datetime.timedelta(hours=1)
+        # Two checkpoints a quarter apart, with overlapping windows of +/- 10 minutes
+        self.patrol_logs = [PatrolLog.objects.create(
+            tag=self.tag, check_datetime=self.check_datetime + datetime.timedelta(minutes=minutes),
+            check_tolerance=datetime.timedelta(minutes=10)) for minutes in (0, 15)]
+
+    def scan(self, minutes, employee=None):
+        return self.client.post('/core/api/patrol-logs/scan/', {
+            'code_nfc': self.tag.code_nfc, 'employee': (employee or self.employee).pk,
+            'scanned_at': (self.check_datetime + datetime.timedelta(minutes=minutes)).isoformat()}, format='json')
+
+    def test_window_matching(self):
+        self.assertEqual(self.scan(-11).status_code, 404)
+        self.assertEqual(self.scan(26).status_code, 404)
+        # Both windows are open, the earliest checkpoint is checked first
+        self.assertEqual(self.scan(8).data['id'], self.patrol_logs[0].pk)
+        self.assertEqual(self.scan(9).data['id'], self.patrol_logs[1].pk)
+        self.assertEqual(self.scan(10).data['code'], 'no_open_checkpoint')
+
+    def test_window_bounds_are_included(self):
+        self.assertEqual(self.scan(-10).data['id'], self.patrol_logs[0].pk)
+        self.assertEqual(self.scan(25).data['id'], self.patrol_logs[1].pk)
+
+    def test_replayed_sync(self):
+        scans = [{'code_nfc': self.tag.code_nfc, 'employee': self.employee.pk,
+                  'scanned_at': (self.check_datetime + datetime.timedelta(minutes=minutes)).isoformat()}
+                 for minutes in (0, 15, 30)]
+        first = self.client.post('/core/api/patrol-logs/sync/', scans, format='json').data
+        self.assertEqual([result['status'] for result in first], ['checked', 'checked', 'no_open_checkpoint'])
+        second = self.client.post('/core/api/patrol-logs/sync/', scans, format='json').data
+        self.assertEqual([result['status'] for result in second],
+                         ['already_checked', 'already_checked', 'no_open_checkpoint'])
+        self.assertEqual([result.get('patrol_log') for result in second],
+                         [result.get('patrol_log') for result in first])
+        # The same scan by another employee is not a replay
+        other = Employee.objects.create(designation='Other guard', code_pin='1234', site=self.employee.site)
+        self.assertEqual(self.scan(0, employee=other).data['code'], 'no_open_checkpoint')
+        self.assertEqual(self.scan(0).data['id'], self.patrol_logs[0].pk)
+
+    def test_late_sync_clears_missed_checkpoints(self):
+        sweep_missed_checkpoints(now=self.check_datetime + datetime.timedelta(hours=1))
+        self.assertEqual(MissedCheckpoint.objects.count(), 2)
+        self.assertEqual(self.scan(0).status_code, 200)
+        self.assertEqual(list(MissedCheckpoint.objects.values_list('patrol_log', flat=True)), [self.patrol_logs[1].pk])
+        response = self.client.patch(f'/core/api/patrol-logs/{self.patrol_logs[1].pk}/', {'is_checked': True},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(MissedCheckpoint.objects.exists())
+
+    def test_guards_need_the_change_permission(self):
+        guard = User.objects.create_user('guard', 'guard@example.com', 'password')
+        TenantMembership.objects.create(user=guard, enterprise=self.employee.site.enterprise)
+        guard.user_permissions.add(Permission.objects.get(codename='add_patrollog'))
+        self.client.force_authenticate(User.objects.get(pk=guard.pk))
+        sync = [{'code_nfc': self.tag.code_nfc, 'employee': self.employee.pk,
+                 'scanned_at': self.check_datetime.isoformat()}]
+        self.assertEqual(self.scan(0).status_code, 403)
+        self.assertEqual(self.client.post('/core/api/patrol-logs/sync/', sync, format='json').status_code, 403)
+        guard.user_permissions.set([Permission.objects.get(codename='change_patrollog')])
+        self.client.force_authenticate(User.objects.get(pk=guard.pk))
+        self.assertEqual(self.scan(0).data['id'], self.patrol_logs[0].pk)
+        self.assertEqual(self.client.post('/core/api/patrol-logs/sync/', sync, format='json').data[0]['status'],
+                         'already_checked')
+
+    def test_other_site(self):
+        other_site = Site.objects.create(designation='Other', enterprise=self.employee.site.enterprise)
+        employee = Employee.objects.create(designation='Other guard', code_pin='1234', site=other_site)
+        self.assertEqual(self.scan(0, employee=employee).data['code'], 'wrong_site')
+
+
+class DeadlineQueueTests(APITestCase):
+
+    def setUp(self):
+        self.tag = Tag.objects.create(
+            zone=Zone.objects.create(designation='Zone', site=Site.objects.create(
+                designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))),
+            code_nfc='nfc', designation='Tag', order=1, observation='')
+        self.now = timezone.now()
+        self.queue = DeadlineQueue(horizon=datetime.timedelta(hours=1))
+        self.queue.load(self.now)
+
+    def create_checkpoint(self, minutes):
+        return PatrolLog.objects.create(tag=self.tag, check_datetime=self.now + datetime.timedelta(minutes=minutes),
+                                        check_tolerance=datetime.timedelta(0))
+
+    def at(self, minutes):
+        return self.now + datetime.timedelta(minutes=minutes)
+
+    def test_push_discard_pop(self):
+        self.queue.push(1, self.at(10))
+        self.queue.push(2, self.at(5))
+        self.queue.push(3, self.at(90))
+        # Moved deadlines only expire at their new time
+        self.queue.push(1, self.at(2))
+        self.queue.push(1, self.at(2))
+        self.queue.discard(2)
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(self.queue.pop_expired(self.at(1)), [])
+        self.assertEqual(self.queue.pop_expired(self.at(3)), [1])
+        self.assertEqual(self.queue.pop_expired(self.at(60)), [])
+
+    def test_refresh(self):
+        first = self.create_checkpoint(10)
+        self.queue.refresh(self.now)
+        self.assertEqual(len(self.queue), 1)
+        # Planned in a transaction started before the first checkpoint and committed after the refresh
+        late = self.create_checkpoint(20)
+        PatrolLog.objects.filter(pk=late.pk).update(modified=first.modified - datetime.timedelta(minutes=1))
+        self.queue.refresh(self.now)
+        PatrolLog.objects.filter(pk=first.pk).update(is_checked=True, modified=timezone.now())
+        self.queue.refresh(self.now)
+        self.assertEqual(self.queue.pop_expired(self.at(30)), [late.pk])
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        site = Site.objects.create(designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))
+        self.zone = Zone.objects.create(designation='Zone', site=site)
+        self.tag = Tag.objects.create(zone=self.zone, code_nfc='nfc', designation='Tag', order=1, observation='')
+        other_tag = Tag.objects.create(zone=Zone.objects.create(designation='Other', site=site), code_nfc='other',
+                                       designation='Other tag', order=1, observation='')
+        self.employee = Employee.objects.create(designation='Guard', code_pin='1234', site=site)
+        now = timezone.now().replace(microsecond=0)
+        self.checked, self.other = [PatrolLog.objects.create(
+            tag=tag, check_datetime=now - datetime.timedelta(hours=hours),
+            check_tolerance=datetime.timedelta(minutes=10)) for tag, hours in ((self.tag, 3), (other_tag, 1))]
+        PatrolLog.objects.filter(pk=self.checked.pk).update(is_checked=True, checked_by=self.employee)
+        # Archived rows planned before and between the live ones, with larger ids
+        self.archived = [ArchivedPatrolLog.objects.create(
+            id=self.other.pk + index + 1, tag=self.tag, site=site, check_datetime=now - datetime.timedelta(hours=hours),
+            check_tolerance=datetime.timedelta(minutes=10), created=now, modified=now)
+            for index, hours in enumerate((4, 2))]
+        cache.delete(ARCHIVE_BOUNDARY_CACHE_KEY)
+
+    def export(self, query=''):
+        response = self.client.get(f'/core/api/patrol-logs/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        header, *rows = csv.reader(io.StringIO(self.export()))
+        self.assertEqual(header, [name for name, _ in PATROL_LOG_COLUMNS])
+        self.assertEqual([int(row[0]) for row in rows],
+                         [self.archived[0].pk, self.checked.pk, self.archived[1].pk, self.other.pk])
+        row = dict(zip(header, rows[1]))
+        self.assertEqual((row['tag__designation'], row['zone__designation'], row['check_tolerance']),
+                         ('Tag', 'Zone', '00:10:00'))
+        self.assertEqual((row['is_checked'], row['checked_by'], row['checked_datetime']),
+                         ('True', str(self.employee.pk), ''))
+        self.assertEqual(datetime.datetime.fromisoformat(row['check_datetime']), self.checked.check_datetime)
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('?type=ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [self.archived[0].pk, self.checked.pk, self.archived[1].pk, self.other.pk])
+        self.assertEqual((rows[1]['is_checked'], rows[1]['checked_by'], rows[1]['checked_datetime']),
+                         (True, self.employee.pk, None))
+
+    def test_filters(self):
+        rows = [json.loads(line) for line in self.export(f'?type=ndjson&zone={self.zone.pk}&is_checked=false')
+                .splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.archived[0].pk, self.archived[1].pk])
+        rows = self.export(f'?type=ndjson&employee={self.employee.pk}').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.checked.pk])
+        self.assertEqual(self.client.get('/core/api/patrol-logs/export/?zone=x').status_code, 400)
+
+    def test_unknown_type(self):
+        response = self.client.get('/core/api/patrol-logs/export/?type=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type', response.data)
+
+
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        tag = Tag.objects.create(zone=Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))),
+            code_nfc='nfc', designation='Tag', order=1, observation='')
+        self.now = timezone.now()
+        self.patrol_logs = [PatrolLog.objects.create(
+            tag=tag, check_datetime=self.now - datetime.timedelta(days=days),
+            check_tolerance=datetime.timedelta(minutes=10)) for days in (10, 9, 8, 7, 6, 0)]
+        self.missed = MissedCheckpoint.objects.create(
+            patrol_log=self.patrol_logs[0], site_id=tag.zone.site_id, due_datetime=self.patrol_logs[0].due_datetime,
+            detected_datetime=self.now - datetime.timedelta(days=9))
+        self.ids = [patrol_log.pk for patrol_log in self.patrol_logs]
+
+    def archive(self, chunk_size=2):
+        return archive_patrol_logs(self.now - datetime.timedelta(days=1), chunk_size=chunk_size)
+
+    def test_chunks(self):
+        with mock.patch.object(ArchivedPatrolLog.objects, 'bulk_create',
+                               wraps=ArchivedPatrolLog.objects.bulk_create) as bulk_create:
+            self.assertEqual(self.archive(), 5)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1])
+        self.assertEqual(list(PatrolLog.objects.values_list('pk', flat=True)), self.ids[5:])
+        self.assertEqual(list(ArchivedPatrolLog.objects.order_by('check_datetime').values_list('pk', flat=True)),
+                         self.ids[:5])
+        self.assertEqual(self.archive(), 0)
+
+    def test_missed_datetime(self):
+        self.archive()
+        self.assertEqual(ArchivedPatrolLog.objects.get(pk=self.ids[0]).missed_datetime,
+                         self.missed.detected_datetime)
+        self.assertIsNone(ArchivedPatrolLog.objects.get(pk=self.ids[1]).missed_datetime)
+        self.assertFalse(MissedCheckpoint.objects.exists())
+
+    def test_rows_already_archived(self):
+        # A row copied by an earlier run keeps its archived version
+        row = PatrolLog.objects.filter(pk=self.ids[1]).values(*ARCHIVED_FIELDS).get()
+        ArchivedPatrolLog.objects.create(**{**row, 'description_anomaly': 'Archived'})
+        self.assertEqual(self.archive(), 5)
+        self.assertEqual(ArchivedPatrolLog.objects.count(), 5)
+        self.assertEqual(ArchivedPatrolLog.objects.get(pk=self.ids[1]).description_anomaly, 'Archived')
+
+    def test_reads_across_the_archive(self):
+        self.archive()
+        ids = []
+        url = '/core/api/patrol-logs/?page_size=4'
+        while url:
+            data = self.client.get(url).data
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, self.ids)
+        response = self.client.get(f'/core/api/patrol-logs/{self.ids[0]}/')
+        self.assertEqual((response.status_code, response.data['id']), (200, self.ids[0]))
+        self.assertEqual(self.client.get('/core/api/patrol-logs/0/').status_code, 404)
+        response = self.client.get('/core/api/patrol-logs/export/?type=ndjson')
+        self.assertEqual([json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()],
+                         self.ids)
+        # A period after the archive does not read it
+        start = (self.now - datetime.timedelta(days=1)).isoformat().replace('+', '%2B')
+        self.assertEqual([row['id'] for row in self.client.get(f'/core/api/patrol-logs/?from={start}').data['results']],
+                         self.ids[5:])
+
+
+class ImageProcessingTests(APITestCase):
+
+    def setUp(self):
+        self.tag = Tag.objects.create(zone=Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))),
+            code_nfc='nfc', designation='Tag', order=1, observation='')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=directory.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def photo(self, name='images/photo.png', color='red'):
+        """Store a 3000x1500 photo taken by a camera held sideways, with its EXIF metadata."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x0112] = 6
+        output = io.BytesIO()
+        Image.new('RGB', (3000, 1500), color).save(output, 'PNG', exif=exif.tobytes())
+        return default_storage.save(name, ContentFile(output.getvalue()))
+
+    def create_patrol_log(self, image_path):
+        return PatrolLog.objects.create(tag=self.tag, check_datetime=timezone.now(), image_path=image_path,
+                                        check_tolerance=datetime.timedelta(minutes=10))
+
+    def test_processing(self):
+        original = self.photo()
+        patrol_log = self.create_patrol_log(original)
+        name = process_patrol_log_image(patrol_log.pk)
+        patrol_log.refresh_from_db()
+        self.assertEqual(patrol_log.image_path.name, name)
+        self.assertRegex(name, PROCESSED_NAME_RE)
+        with default_storage.open(name) as file, Image.open(file) as image:
+            # Rotated upright and scaled down, without metadata
+            self.assertEqual((image.format, image.size), ('JPEG', (1024, 2048)))
+            self.assertEqual(dict(image.getexif()), {})
+        with default_storage.open(patrol_log.image_thumbnail.name) as file, Image.open(file) as image:
+            self.assertEqual(image.size, (160, 320))
+        self.assertFalse(default_storage.exists(original))
+
+    def test_identical_photos_are_stored_once(self):
+        patrol_logs = [self.create_patrol_log(self.photo(f'images/photo{index}.png')) for index in range(2)]
+        names = {process_patrol_log_image(patrol_log.pk) for patrol_log in patrol_logs}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(len(default_storage.listdir(os.path.dirname(names.pop()))[1]), 1)
+
+    def test_processed_photos_are_skipped(self):
+        patrol_log = self.create_patrol_log(self.photo())
+        name = process_patrol_log_image(patrol_log.pk)
+        with mock.patch('core.images.process_image') as process_image:
+            self.assertEqual(process_patrol_log_image(patrol_log.pk), name)
+        process_image.assert_not_called()
+
+    def test_shared_originals_are_kept(self):
+        original = self.photo()
+        patrol_logs = [self.create_patrol_log(original) for _ in range(2)]
+        process_patrol_log_image(patrol_logs[0].pk)
+        self.assertTrue(default_storage.exists(original))
+        process_patrol_log_image(patrol_logs[1].pk)
+        self.assertFalse(default_storage.exists(original))
+
+
+class RoundTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        site = Site.objects.create(designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise'))
+        self.employee = Employee.objects.create(designation='Guard', code_pin='1234', site=site)
+        zone = Zone.objects.create(designation='Zone', site=site)
+        self.tags = [Tag.objects.create(zone=zone, code_nfc=f'nfc{order}', designation='Tag', order=order,
+                                        observation='') for order in (2, 1)]
+        now = timezone.now()
+        self.patrol_logs = {name: PatrolLog.objects.create(
+            tag=tag, check_datetime=now + datetime.timedelta(minutes=minutes),
+            check_tolerance=datetime.timedelta(minutes=10)) for name, tag, minutes in (
+                ('current', self.tags[0], -5), ('current first', self.tags[1], -5), ('next', self.tags[0], 30),
+                ('later', self.tags[0], 180), ('expired', self.tags[0], -30))}
+        self.url = f'/core/api/employees/{self.employee.pk}/round/'
+
+    def test_round(self):
+        response = self.client.get(self.url)
+        self.assertEqual([row['id'] for row in response.data['current']],
+                         [self.patrol_logs['current first'].pk, self.patrol_logs['current'].pk])
+        self.assertEqual([row['id'] for row in response.data['next']], [self.patrol_logs['next'].pk])
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_scans_change_the_round(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.post('/core/api/patrol-logs/scan/', {
+            'code_nfc': self.tags[1].code_nfc, 'employee': self.employee.pk}, format='json')
+        self.assertEqual(response.data['id'], self.patrol_logs['current first'].pk)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([row['id'] for row in response.data['current']], [self.patrol_logs['current'].pk])
+
+
+class ComplianceRollupTests(APITestCase):
+
+    def setUp(self):
+        self.zone = Zone.objects.create(designation='Zone', site=Site.objects.create(
+            designation='Site', enterprise=Enterprise.objects.create(designation='Enterprise')))
+        self.tags = [Tag.objects.create(zone=self.zone, code_nfc=f'nfc{order}', designation='Tag', order=order,
+                                        observation='') for order in range(2)]
+        self.check_datetime = timezone.now() + datetime.timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            for tag in self.tags:
+                self.create_checkpoint(tag)
+
+    def create_checkpoint(self, tag):
+        return PatrolLog.objects.create(tag=tag, check_datetime=self.check_datetime,
+                                        check_tolerance=datetime.timedelta(minutes=10))
+
+    def planned(self):
+        return ComplianceRollup.objects.filter(zone=self.zone).values_list('planned', flat=True).first()
+
+    def test_saves_refresh_the_day_once_committed(self):
+        self.assertEqual(self.planned(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_checkpoint(self.tags[0])
+            self.assertEqual(self.planned(), 2)
+        self.assertEqual(self.planned(), 3)
+
+    def test_failed_refreshes_keep_the_write(self):
+        with mock.patch('core.compliance.count_checkpoints', side_effect=DatabaseError), \
+                self.assertLogs('core.compliance', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            checkpoint = self.create_checkpoint(self.tags[0])
+        self.assertTrue(PatrolLog.objects.filter(pk=checkpoint.pk).exists())
+        self.assertEqual(self.planned(), 2)
+
+    def test_tag_deletes_refresh_the_days(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].delete()
+        self.assertEqual(self.planned(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[1].delete()
+        self.assertEqual(self.planned(), 0)
@@ -0,0 +1,165 @@
+"""
+Chunked, resumable upload of voice memos.
+
+An upload is declared with its total size, then its content is sent in chunks, each
+one starting at the offset received so far. Chunks are streamed to a part file on disk
+block by block, outside of any transaction, and the bytes written before a dropped
+connection are kept, so the client resumes from the offset returned by the API instead
+of starting over. The complete memo is stored under the SHA-256 of its content, with the
+extension of the audio format found in its first bytes, and linked to its PatrolLog.
+"""
+import fcntl
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from core.models import AudioUpload, PatrolLog
+
+AUDIO_UPLOAD_DIR = getattr(settings, 'AUDIO_UPLOAD_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads'))
+AUDIO_UPLOAD_MAX_SIZE = getattr(settings, 'AUDIO_UPLOAD_MAX_SIZE', 50 * 1024 * 1024)
+BLOCK_SIZE = 64 * 1024
+AUDIO_EXTENSIONS = ('.aac', '.m4a', '.mp3', '.ogg', '.wav')
+
+
+class UploadError(Exception):
+    OFFSET_MISMATCH = 'offset_mismatch'
+    TOO_LARGE = 'too_large'
+    COMPLETED = 'completed'
+    INTERRUPTED = 'interrupted'
+    BUSY = 'busy'
+    UNSUPPORTED = 'unsupported'
+
+    def __init__(self, code, message, offset=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.offset = offset
+
+
+def part_path(upload):
+    return os.path.join(AUDIO_UPLOAD_DIR, f'{upload.pk}.part')
+
+
+def sniff_audio_extension(head):
+    """Return the extension of the audio format the first bytes of a file belong to, None when unknown."""
+    if head[4:8] == b'ftyp':
+        return '.m4a'
+    if head[:4] == b'OggS':
+        return '.ogg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return '.wav'
+    if head[:3] == b'ID3':
+        return '.mp3'
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync: a layer of 0 is an ADTS (AAC) header, the others MPEG audio frames
+        return '.aac' if head[1] & 0x06 == 0 else '.mp3'
+    return None
+
+
+def append_chunk(upload_id, offset, stream):
+    """
+    Write the chunk read from `stream` at `offset` of the upload and return the upload.
+
+    The part file is locked for the duration of the write, so two chunks of the same
+    upload are never written at once, and no transaction is held while the chunk is
+    received. The new offset is saved only if no other request moved it meanwhile. The
+    upload is completed once its last byte is written.
+    """
+    upload = AudioUpload.objects.get(pk=upload_id)
+    check_offset(upload, offset)
+
+    os.makedirs(AUDIO_UPLOAD_DIR, exist_ok=True)
+    with open(os.open(part_path(upload), os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError(UploadError.BUSY, 'A chunk of this upload is being received, retry later.',
+                              upload.offset)
+        upload.refresh_from_db()
+        check_offset(upload, offset)
+
+        start = upload.offset
+        part.seek(start)
+        interrupted = too_large = False
+        try:
+            while True:
+                block = stream.read(BLOCK_SIZE) if stream is not None else b''
+                if not block:
+                    break
+                if upload.offset + len(block) > upload.size:
+                    # A chunk longer than the rest of the memo is refused as a whole
+                    too_large = True
+                    upload.offset = start
+                    break
+                part.write(block)
+                upload.offset += len(block)
+        except (OSError, UnreadablePostError):
+            interrupted = True
+        part.truncate(upload.offset)
+        part.flush()
+
+        upload.modified = timezone.now()
+        if not AudioUpload.objects.filter(pk=upload.pk, offset=start, completed__isnull=True).update(
+                offset=upload.offset, modified=upload.modified):
+            offset = AudioUpload.objects.filter(pk=upload.pk).values_list('offset', flat=True).first()
+            raise UploadError(UploadError.OFFSET_MISMATCH, 'The upload changed while the chunk was received.', offset)
+
+        if too_large:
+            raise UploadError(UploadError.TOO_LARGE, f'The upload is limited to {upload.size} bytes.', upload.offset)
+        if interrupted:
+            raise UploadError(UploadError.INTERRUPTED, 'The chunk was interrupted, resume from the offset.',
+                              upload.offset)
+        if upload.offset == upload.size:
+            complete_upload(upload, part)
+    return upload
+
+
+def check_offset(upload, offset):
+    if upload.completed is not None:
+        raise UploadError(UploadError.COMPLETED, 'This upload is already complete.', upload.offset)
+    if offset != upload.offset:
+        raise UploadError(UploadError.OFFSET_MISMATCH, f'Expected offset {upload.offset}.', upload.offset)
+
+
+def complete_upload(upload, part):
+    """
+    Store the complete memo under its content hash and link it to the patrol log.
+
+    The extension of the stored file comes from its content, never from the name given
+    by the client: a memo that is not a known audio format is refused and discarded.
+    """
+    part.seek(0)
+    extension = sniff_audio_extension(part.read(12))
+    if extension is None:
+        discard_upload(upload)
+        raise UploadError(UploadError.UNSUPPORTED, 'The memo is not a supported audio file.')
+
+    part.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+        digest.update(block)
+    name = f'audio/{digest.hexdigest()[:2]}/{digest.hexdigest()}{extension}'
+    if not default_storage.exists(name):
+        part.seek(0)
+        name = default_storage.save(name, File(part))
+
+    now = timezone.now()
+    with transaction.atomic():
+        PatrolLog.objects.filter(pk=upload.patrol_log_id).update(audio_path=default_storage.url(name), modified=now)
+        upload.completed = now
+        upload.save(update_fields=['completed', 'modified'])
+    os.remove(part_path(upload))
+    return name
+
+
+def discard_upload(upload):
+    """Delete an upload and its part file."""
+    if os.path.exists(part_path(upload)):
+        os.remove(part_path(upload))
+    upload.delete()
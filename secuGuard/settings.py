@@ -127,12 +127,84 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.renderers.MessagePackParser',
+    ],
     # 'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
 }
 
+# Page size of the paginated API lists, clients can ask for up to API_MAX_PAGE_SIZE rows with ?page_size=
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Cache shared by every process (gunicorn workers, management commands): the cached reference data,
+# permissions, API tokens and tenant scopes are invalidated across processes through it. Without
+# MEMCACHED_LOCATION each process has its own memory cache and they are only kept for a request.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION,
+        }
+    }
+
+AUTHENTICATION_BACKENDS = ['core.permissions.CachedModelBackend']
+# Lifetime of the cached permission sets of the users
+PERMISSION_CACHE_TTL = 60 * 60
+
+# Lifetime of the cached tenant scopes (enterprises/sites a user can see, see core.tenancy)
+TENANT_SCOPE_TTL = 60 * 60
+
+# API tokens: lifetime of the cached token -> user lookups, and number of lookups each process
+# counts before adding them to the shared hit/miss counters (manage.py token_cache_stats)
+AUTH_TOKEN_CACHE_TTL = 300
+AUTH_TOKEN_STATS_BATCH = 100
+
+# Reference data API (enterprises, sites, zones, employees, plannings): lifetime of the cached responses
+REFERENCE_CACHE_TTL = 24 * 60 * 60
+
+# Guard rounds (/core/api/employees/<id>/round/): cache bucket and how far ahead the next checkpoints go
+ROUND_BUCKET_SECONDS = 30
+ROUND_LOOKAHEAD_MINUTES = 120
+
+# NFC scans: lifetime of the in-process code NFC -> tag cache and largest tolerated_time of a planning
+TAG_CACHE_TTL = 300
+SCAN_MAX_TOLERANCE_MINUTES = 24 * 60
+SCAN_SYNC_MAX_EVENTS = 500
+
+# Missed checkpoints: window covered by the very first sweep
+SWEEP_FIRST_WINDOW_MINUTES = 24 * 60
+
+# Archival: patrol logs planned more than this many days ago are moved to the archive table
+ARCHIVE_AFTER_DAYS = 365
+
+# Anomaly photos: largest side of the stored photo and of its thumbnail (px), JPEG quality, worker threads
+IMAGE_MAX_SIZE = 2048
+IMAGE_THUMBNAIL_SIZE = 320
+IMAGE_QUALITY = 85
+IMAGE_WORKERS = 2
+
+# Voice memos: directory of the uploads in progress (outside MEDIA_ROOT) and largest memo accepted (bytes)
+AUDIO_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+AUDIO_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+# Media delivery: set to 'x-accel-redirect' (nginx, internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT)
+# or 'x-sendfile' to let the front proxy send the files once the permissions are checked
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 SWAGGER_SETTINGS = {
 'LOGIN_URL':'/admin/login',
 'LOGOUT_URL': '/admin/logout',
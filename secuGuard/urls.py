@@ -14,14 +14,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.authtoken import views
 
 
 from core import urls as core_urls
+from core.media import MediaView
 from core.views import Home, AppLoginView, AppLogoutView
 from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('', Home.as_view(), name='home'),
@@ -29,5 +29,6 @@ urlpatterns = [
     path('api-token-auth/', views.obtain_auth_token),
     path('auth/logout/', AppLogoutView.as_view(), name='logout'),
     path('admin/', admin.site.urls),
-    path('core/', include(core_urls))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('core/', include(core_urls)),
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), MediaView.as_view(), name='media'),
+]